@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from benchmarks.stores import generate_stores
+from tarenalib.arena import TaskArena
+from tarenalib.io import IOManager
+from tarenalib.options import readers
+from tarenalib.sync import SyncManager
+
+cases = [
+    'fetch',
+    'generate_synclist',
+    'generate_synclist_processes',
+    'suggest_conflict_resolution',
+    'carry_out_sync',
+    'add_remove',
+    'cli_cold_start',
+]
+
+# cases that write to the stores and therefore need the task binary
+write_cases = ['carry_out_sync', 'add_remove']
+
+# cases that only read the stores, they need the task binary unless the
+# tasks are read natively
+read_cases = ['fetch', 'generate_synclist', 'generate_synclist_processes',
+              'suggest_conflict_resolution']
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def task_version():
+    if not shutil.which('task'):
+        return None
+    return subprocess.check_output(['task', '--version']).decode().strip()
+
+
+def run_sync_cases(size, overlap, change_rate, reader, with_writes):
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_location = os.path.join(tmp_dir, 'local')
+        remote_location = os.path.join(tmp_dir, 'remote')
+        generate_stores(local_location, remote_location, size, overlap,
+                        change_rate)
+        arena = TaskArena('bench', local_location, remote_location)
+        arena.reader = reader
+        sm = SyncManager(arena, IOManager(show_output=False))
+        timings['fetch'], (local_tasks, remote_tasks) = timed(
+            lambda: (arena.get_local_tasks(), arena.get_remote_tasks()))
+        timings['generate_synclist'], _ = timed(
+            lambda: sm.generate_synclist(local_tasks, remote_tasks))
+        timings['suggest_conflict_resolution'], _ = timed(
+            sm.suggest_conflict_resolution)
+        # one diff process per core
+        timings['generate_synclist_processes'], _ = timed(
+            lambda: SyncManager(arena, IOManager(show_output=False), 0)
+            .generate_synclist(local_tasks, remote_tasks))
+        if with_writes:
+            for e in sm.synclist:
+                e.action = e.suggestion
+            timings['carry_out_sync'], _ = timed(sm.carry_out_sync)
+            timings['add_remove'], _ = timed(lambda: (
+                arena.tw_local.remove_tasks_matching_pattern(
+                    ['project:house']),
+                arena.tw_local.add_tasks_matching_pattern(
+                    ['project:house'])))
+    return timings
+
+
+def run_cold_start():
+    seconds, _ = timed(lambda: subprocess.check_call(
+        [sys.executable, '-m', 'tarenalib.cli', '--help'],
+        stdout=subprocess.DEVNULL))
+    return seconds
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command(help='Runs the benchmarks and writes the results to OUTPUT.')
+@click.argument('output', type=click.File('w'))
+@click.option('--sizes', default='1000,10000',
+              help='Comma separated numbers of tasks per store.')
+@click.option('--overlap', default=0.8,
+              help='Fraction of tasks present in both stores.')
+@click.option('--change-rate', default=0.05,
+              help='Fraction of shared tasks modified since the last sync.')
+@click.option('--reader', type=click.Choice(readers),
+              default='native')
+@click.option('--repeat', default=3, help='Runs per case, the best counts.')
+@click.option('--cold-start-budget', default=0.15,
+              help='Seconds tarena may take to start, fails the run if '
+                   'exceeded.')
+def run(output, sizes, overlap, change_rate, reader, repeat,
+        cold_start_budget):
+    version = task_version()
+    with_writes = version is not None
+    with_reads = with_writes or reader == 'native'
+    if not with_reads:
+        click.echo('task binary not found, skipping ' +
+                   ', '.join(read_cases + write_cases))
+    elif not with_writes:
+        click.echo('task binary not found, skipping ' + ', '.join(write_cases))
+    results = []
+    for size in [int(s) for s in sizes.split(',')]:
+        runs = dict((case, []) for case in cases)
+        for _ in range(repeat):
+            timings = run_sync_cases(size, overlap, change_rate, reader,
+                                     with_writes) if with_reads else {}
+            timings['cli_cold_start'] = run_cold_start()
+            for case, seconds in timings.items():
+                runs[case].append(seconds)
+        for case in cases:
+            if runs[case]:
+                results.append({'case': case,
+                                'size': size,
+                                'seconds': min(runs[case]),
+                                'runs': runs[case]})
+                click.echo('{0:30} {1:>8} {2:10.4f}s'.format(
+                    case, size, min(runs[case])))
+    json.dump({'meta': {'python': platform.python_version(),
+                        'platform': platform.platform(),
+                        'cores': os.cpu_count(),
+                        'task': version,
+                        'reader': reader,
+                        'overlap': overlap,
+                        'change_rate': change_rate,
+                        'repeat': repeat,
+                        'time': time.strftime('%Y-%m-%dT%H:%M:%S')},
+               'results': results},
+              output, indent=2)
+    cold_start = min(r['seconds'] for r in results
+                     if r['case'] == 'cli_cold_start')
+    if cold_start > cold_start_budget:
+        raise click.ClickException(
+            'cli_cold_start took {0:.4f}s, the budget is {1:.4f}s'.format(
+                cold_start, cold_start_budget))
+
+
+@cli.command(help='Compares the results in OLD and NEW.')
+@click.argument('old', type=click.File('r'))
+@click.argument('new', type=click.File('r'))
+def compare(old, new):
+    old_results = dict(((r['case'], r['size']), r['seconds'])
+                       for r in json.load(old)['results'])
+    for r in json.load(new)['results']:
+        key = (r['case'], r['size'])
+        if key in old_results:
+            click.echo('{0:30} {1:>8} {2:10.4f}s {3:10.4f}s {4:7.2f}x'.format(
+                r['case'], r['size'], old_results[key], r['seconds'],
+                old_results[key] / r['seconds'] if r['seconds'] else 0))
+
+
+if __name__ == '__main__':
+    cli()
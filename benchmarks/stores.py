@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import json
+import os
+import random
+import uuid
+
+base_time = 1420070400
+
+priorities = ['', 'L', 'M', 'H']
+projects = ['house', 'garden', 'work', 'errands', '']
+tags = ['home', 'paint', 'phone', 'shop', 'urgent']
+
+
+def format_line(data):
+    """ Encodes a task as a line of a TaskWarrior data file. """
+    attrs = []
+    for key in sorted(data):
+        value = json.dumps(str(data[key]), ensure_ascii=False)[1:-1]
+        value = value.replace('[', '&open;').replace(']', '&close;')
+        attrs.append(key + ':"' + value + '"')
+    return '[' + ' '.join(attrs) + ']\n'
+
+
+def write_store(data_location, tasks):
+    if not os.path.isdir(data_location):
+        os.makedirs(data_location)
+    with open(os.path.join(data_location, 'pending.data'), 'w') as f:
+        f.writelines(format_line(t) for t in tasks
+                     if t['status'] == 'pending')
+    with open(os.path.join(data_location, 'completed.data'), 'w') as f:
+        f.writelines(format_line(t) for t in tasks
+                     if t['status'] != 'pending')
+
+
+def random_task(rnd, arena, number):
+    entry = base_time + number
+    task = {
+        'uuid': str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+        'description': 'task number ' + str(number),
+        'entry': entry,
+        'modified': entry,
+        'status': 'completed' if rnd.random() < 0.2 else 'pending',
+        'Arena': arena,
+        'ArenaTaskID': str(uuid.UUID(int=rnd.getrandbits(128), version=4)),
+    }
+    if task['status'] == 'completed':
+        task['end'] = entry
+    priority = rnd.choice(priorities)
+    if priority:
+        task['priority'] = priority
+    project = rnd.choice(projects)
+    if project:
+        task['project'] = project
+    task_tags = rnd.sample(tags, rnd.randint(0, 2))
+    if task_tags:
+        task['tags'] = ','.join(task_tags)
+    return task
+
+
+def change_task(rnd, task, modified):
+    task = dict(task)
+    task['modified'] = modified
+    if rnd.random() < 0.5:
+        task['description'] += ' (changed)'
+    else:
+        task['priority'] = rnd.choice([p for p in priorities
+                                       if p != task.get('priority')]) or 'L'
+    return task
+
+
+def generate_stores(local_location, remote_location, size, overlap=0.8,
+                    change_rate=0.05, arena='bench', seed=0):
+    """ Writes a local and a remote store with size arena tasks each.
+
+        overlap is the fraction of tasks present in both stores, the others
+        exist on one side only. change_rate is the fraction of shared tasks
+        that have been modified since they were last synced, half of them
+        locally and half of them remotely.
+    """
+    rnd = random.Random(seed)
+    shared = int(size * overlap)
+    local_tasks = []
+    remote_tasks = []
+    for number in range(shared):
+        task = random_task(rnd, arena, number)
+        local_task = task
+        remote_task = dict(task, uuid=str(uuid.UUID(
+            int=rnd.getrandbits(128), version=4)))
+        if rnd.random() < change_rate:
+            modified = base_time + size + number
+            if rnd.random() < 0.5:
+                local_task = change_task(rnd, local_task, modified)
+            else:
+                remote_task = change_task(rnd, remote_task, modified)
+        local_tasks.append(local_task)
+        remote_tasks.append(remote_task)
+    for number in range(shared, size):
+        local_tasks.append(random_task(rnd, arena, number))
+        remote_tasks.append(random_task(rnd, arena, size + number))
+    write_store(local_location, local_tasks)
+    write_store(remote_location, remote_tasks)
@@ -12,8 +12,9 @@ setup(
     author_email='mail@nikno.de',
     license='GNU GPLv2',
     url='https://github.com/niknow/TaskArena/tree/master/tarenalib',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     install_requires=['tasklib==0.10.0', 'click==5.1'],
+    extras_require={'numpy': ['numpy']},
     test_suite='tarenalib.tests',
     entry_points={
         'console_scripts': [
@@ -19,16 +19,19 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
+import datetime
 import json
+import os
+import tempfile
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 import tasklib.task as tlib
-
-uda_config_list = [
-    ['uda.Arena.type', 'string'],
-    ['uda.Arena.label', 'Arena'],
-    ['uda.ArenaTaskID.type', 'string'],
-    ['uda.ArenaTaskID.label', 'ArenaTaskID'],
-]
+from tarenalib.native import NativeReader, NativeReaderError
+from tarenalib.index import TaskIndex
+from tarenalib import profiling
+from tarenalib import taskrc
+from tarenalib.taskrc import uda_config_list
 
 tw_attrs_editable = [
     'depends',
@@ -61,57 +64,227 @@ tw_attrs_read_only = [
     'modified'
 ]
 
+tw_attrs_not_imported = [
+    'id',
+    'urgency',
+]
+
+# how much earlier than the watermark of a sync the next sync looks for
+# modified tasks, for clocks of collaborators that are behind
+sync_margin = datetime.timedelta(minutes=10)
+
+# bit of each editable field in a field mask
+field_bits = dict((field, 1 << i) for i, field in enumerate(tw_attrs_editable))
+
+
+def fields_to_mask(fields):
+    mask = 0
+    for field in fields:
+        mask |= field_bits[field]
+    return mask
+
+
+def mask_to_fields(mask):
+    return [field for field in tw_attrs_editable if mask & field_bits[field]]
+
+
+def run_concurrently(*calls):
+    """ Runs the given functions in threads of their own and returns their
+        results in order.
+    """
+    with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        futures = [executor.submit(call) for call in calls]
+        return [future.result() for future in futures]
+
+
+def limit_task_calls(tw, semaphore):
+    """ Lets commands of tw only run while holding semaphore. """
+    execute_command = tw.execute_command
+
+    def limited_execute_command(*args, **kwargs):
+        with semaphore:
+            return execute_command(*args, **kwargs)
+
+    tw.execute_command = limited_execute_command
+    return tw
+
+
+def normalize_value(value):
+    """ Returns a string representation of a task field value that does not
+        depend on the store the task has been read from.
+    """
+    if not value:
+        return ''
+    if isinstance(value, datetime.datetime):
+        return value.astimezone(datetime.timezone.utc).strftime(
+            tlib.DATE_FORMAT)
+    if isinstance(value, (set, frozenset, list, tuple)):
+        return ','.join(sorted(normalize_value(v) for v in value))
+    if isinstance(value, tlib.Task):
+        return value['uuid']
+    return str(value)
+
+
+def raw_value(data, field):
+    """ Returns the normalized value of field in data exported from a
+        store, without deserializing it.
+    """
+    return normalize_exported_value(field, data.get(field))
+
+
+def normalize_exported_value(field, value):
+    if field == 'depends' and isinstance(value, str):
+        value = value.split(',')
+    return normalize_value(value)
+
 
 class SharedTask(object):
-    """ A Task that can be shared in a TaskArena."""
+    """ A Task that can be shared in a TaskArena. A task read from a store
+        keeps the data exported for it and serves and takes its fields as
+        exported values, so that the tasklib Task is only built when it is
+        needed.
+    """
+
+    __slots__ = ('_tw_task', '_Arena', '_ArenaTaskID', '_data', '_exported',
+                 '_loader', '_snapshot')
 
-    def __init__(self, tw_task, arena=None):
-        self.tw_task = tw_task
+    def __init__(self, tw_task=None, arena=None, data=None, loader=None):
+        self._tw_task = tw_task
+        self._data = data
+        self._exported = None
+        self._loader = loader
+        self._snapshot = None
         self.Arena = arena
         self._ArenaTaskID = None
 
+    def _get_tw_task(self):
+        if self._tw_task is None and self._data is not None:
+            if self._exported is None:
+                self._tw_task = self._loader(self._data)
+            else:
+                # load what the store holds and apply the changes on top,
+                # so that tasklib sees them as modified fields
+                self._tw_task = self._loader(self._exported)
+                self._tw_task._update_data(self._data, remove_missing=True)
+            self._data = None
+            self._exported = None
+            self._snapshot = None
+        return self._tw_task
+
+    def _set_tw_task(self, value):
+        self._tw_task = value
+        self._data = None
+        self._exported = None
+        self._snapshot = None
+
+    tw_task = property(_get_tw_task, _set_tw_task)
+
+    def get(self, field):
+        """ The normalized value of field. Values of exported data are
+            normalized once.
+        """
+        if self._data is None:
+            return normalize_value(self.tw_task[field])
+        if self._snapshot is None:
+            self._snapshot = {}
+        try:
+            return self._snapshot[field]
+        except KeyError:
+            value = self._snapshot[field] = raw_value(self._data, field)
+            return value
+
+    def _write(self, field, value):
+        """ Writes value to field, unless the exported data of the task
+            already holds it.
+        """
+        if self._data is None:
+            self.tw_task[field] = value
+        elif raw_value(self._data, field) != normalize_value(value):
+            self._write_raw(field, value)
+
+    def _write_raw(self, field, value):
+        """ Writes an exported value to the exported data of the task. The
+            data as read from the store is kept aside on the first write.
+        """
+        if self._exported is None:
+            self._exported = self._data
+            self._data = dict(self._data)
+        if value in (None, '', []):
+            self._data.pop(field, None)
+        else:
+            self._data[field] = value
+        if self._snapshot is not None:
+            self._snapshot.pop(field, None)
+
+    def _copy_field(self, other, field):
+        """ Copies field from other, as the value exported for it if other
+            has not been changed through its tasklib Task.
+        """
+        if other._data is None:
+            self.tw_task[field] = other.tw_task[field]
+        elif self._data is None:
+            self.tw_task[field] = self.tw_task._deserialize(
+                field, other._data.get(field))
+        else:
+            self._write_raw(field, other._data.get(field))
+
     def _get_arena(self):
         return self._Arena
 
     def _set_arena(self, value):
         self._Arena = value
         if value:
-            self.tw_task['Arena'] = self.Arena.name
+            self._write('Arena', self.Arena.name)
             if not self.ArenaTaskID:
-                self.ArenaTaskID = uuid.uuid4()
+                self.ArenaTaskID = str(uuid.uuid4())
         else:
             self.remove()
 
     Arena = property(_get_arena, _set_arena)
 
     def _get_arena_task_id(self):
+        if self._data is not None:
+            return raw_value(self._data, 'ArenaTaskID')
         return self.tw_task['ArenaTaskID']
 
     def _set_arena_task_id(self, value):
-        self.tw_task['ArenaTaskID'] = value
+        self._write('ArenaTaskID', value)
 
     ArenaTaskID = property(_get_arena_task_id, _set_arena_task_id)
 
     def remove(self):
-        self.tw_task['Arena'] = ''
-        self.tw_task['ArenaTaskID'] = ''
+        self._write('Arena', '')
+        self._write('ArenaTaskID', '')
 
     def last_modified(self):
-        return self.tw_task['modified'] \
-            if self.tw_task['modified'] \
-            else self.tw_task['entry']
-
-    def update(self, other):
+        return self.get('modified') or self.get('entry')
+
+    def field_values(self):
+        return dict((field, self.get(field)) for field in tw_attrs_editable)
+
+    def exported_fields(self):
+        """ The data exported for the task, or the normalized values of its
+            editable fields once it has a tasklib Task. raw_value normalizes
+            the fields of either.
+        """
+        if self._data is not None:
+            return self._data
+        return self.field_values()
+
+    def update(self, other, fields=None):
+        for field in fields if fields is not None else tw_attrs_editable:
+            if self.get(field) != other.get(field):
+                self._copy_field(other, field)
+
+    def different_fields_mask(self, other):
+        mask = 0
         for field in tw_attrs_editable:
-            if self.tw_task[field] != other.tw_task[field]:
-                self.tw_task[field] = other.tw_task[field]
+            if self.get(field) != other.get(field):
+                mask |= field_bits[field]
+        return mask
 
     def different_fields(self, other):
-        result = []
-        for field in tw_attrs_editable:
-            if self.tw_task[field] != other.tw_task[field]:
-                result.append(field)
-        return result
+        return mask_to_fields(self.different_fields_mask(other))
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
@@ -133,63 +306,331 @@ class SharedTask(object):
     def save(self):
         self.tw_task.save()
 
+    def set_uuid(self, value):
+        """ Sets the read-only uuid, e.g. of a task about to be imported. """
+        if self._data is None:
+            self.tw_task._data['uuid'] = value
+        else:
+            self._write_raw('uuid', value)
+
+    def load_data(self, data):
+        """ Takes the data a store exported for the task after saving it. """
+        if self._data is None:
+            self.tw_task._load_data(data)
+        else:
+            self._data = data
+            self._exported = None
+            self._snapshot = None
+
+    def export_data(self):
+        if self._data is None:
+            data = json.loads(self.tw_task.export_data())
+        else:
+            data = dict(self._data)
+        for field in tw_attrs_not_imported:
+            data.pop(field, None)
+        return data
+
 
 class EnhancedTaskWarrior(object):
     """ A task warrior that provides additional functionality for managing
         tasks in a TaskArena.
     """
 
-    def __init__(self, tw, arena):
-        self.tw = tw
+    def __init__(self, tw, arena, reader=None, index=None, tw_factory=None):
+        self._tw = tw
+        self._tw_factory = tw_factory
         self.arena = arena
-        for uda in uda_config_list:
-            self.tw.config.update({uda[0]: uda[1]})
+        self.reader = reader
+        self.index = index
+
+    @property
+    def tw(self):
+        """ The TaskWarrior of the store. Without one, it is created by
+            tw_factory once a command has to run.
+        """
+        if self._tw is None:
+            self._tw = self._tw_factory()
+        return self._tw
 
     def tasks(self, pattern):
-        return [SharedTask(task, self.arena) for task in
-                self.tw.tasks.filter(*pattern)]
+        if self.reader:
+            try:
+                return [self._shared_task(data)
+                        for data in self.reader.export(pattern)]
+            except NativeReaderError:
+                pass
+        self.tw.enforce_recurrence()
+        return [self._shared_task(data) for data in self._export(pattern)]
+
+    def _shared_task(self, data):
+        return SharedTask(arena=self.arena, data=data, loader=self._load_task)
+
+    def _load_task(self, data):
+        task = tlib.Task(self.tw)
+        task._load_data(data)
+        return task
+
+    def index_tasks(self, tasks):
+        """ Records the uuids of tasks of the arena in the index. """
+        if self.index is None:
+            return
+        for ta_task in tasks:
+            if ta_task.ArenaTaskID and ta_task.get('uuid'):
+                self.index.set(self.arena.name, ta_task.ArenaTaskID,
+                               ta_task.get('uuid'),
+                               ta_task.last_modified())
+
+    def lookup(self, arena_task_id):
+        """ Returns the (uuid, modified) pair of an ArenaTaskID from the
+            index, or None if the index does not know the task.
+        """
+        if self.index is None:
+            return None
+        return self.index.get(self.arena.name, arena_task_id)
+
+    def tasks_by_arena_task_ids(self, arena_task_ids, chunk_size=100):
+        """ Returns the tasks of the arena with the given ArenaTaskIDs. Tasks
+            known to the index are looked up by their uuid.
+        """
+        arena_task_ids = [str(i) for i in arena_task_ids]
+        result = []
+        if self.index is not None:
+            uuids = [entry[0] for entry in map(self.lookup, arena_task_ids)
+                     if entry]
+            found = set()
+            for start in range(0, len(uuids), chunk_size):
+                chunk = uuids[start:start + chunk_size]
+                for ta_task in self.tasks([
+                    '(' + ' or '.join('uuid:' + u for u in chunk) + ')'
+                ]):
+                    if str(ta_task.ArenaTaskID) in arena_task_ids:
+                        found.add(str(ta_task.ArenaTaskID))
+                        result.append(ta_task)
+            for arena_task_id in arena_task_ids:
+                if arena_task_id not in found:
+                    self.index.discard(self.arena.name, arena_task_id)
+            arena_task_ids = [i for i in arena_task_ids if i not in found]
+        for start in range(0, len(arena_task_ids), chunk_size):
+            chunk = arena_task_ids[start:start + chunk_size]
+            result.extend(self.tasks([
+                'Arena:' + self.arena.name,
+                '(' + ' or '.join('ArenaTaskID:' + str(i) for i in chunk) + ')'
+            ]))
+        self.index_tasks(result)
+        return result
 
     def add_task(self, task):
-        t = SharedTask(tlib.Task(self.tw), self.arena)
-        for field in tw_attrs_editable:
-            t.tw_task[field] = task.tw_task[field]
+        t = self._shared_task({})
+        t.update(task)
         return t
 
     def add_tasks_matching_pattern(self, pattern):
         tasks = self.tasks(pattern)
-        for ta_task in tasks:
-            ta_task.save()
+        self.save_tasks(tasks)
         return tasks
 
     def remove_tasks_matching_pattern(self, pattern):
         tasks = self.tasks(list(pattern) + ['Arena:' + self.arena.name])
         for ta_task in tasks:
+            if self.index is not None:
+                self.index.discard(self.arena.name, ta_task.ArenaTaskID)
             ta_task.remove()
-            ta_task.save()
+        self.save_tasks(tasks)
         return tasks
 
+    def save_tasks(self, tasks, chunk_size=500):
+        """ Saves tasks with as few 'task import' calls as possible.
+            Returns a list of (task, error) pairs in the order of tasks,
+            where error is None if the task has been saved.
+        """
+        results = []
+        for start in range(0, len(tasks), chunk_size):
+            results.extend(self._import_tasks(tasks[start:start + chunk_size]))
+        if self.index is not None:
+            self.index_tasks(task for task, error in results if error is None)
+            self.index.save()
+        return results
+
+    def _import_tasks(self, tasks):
+        new_tasks = set()
+        for ta_task in tasks:
+            if not ta_task.get('uuid'):
+                ta_task.set_uuid(str(uuid.uuid4()))
+                new_tasks.add(id(ta_task))
+        f = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+        try:
+            for ta_task in tasks:
+                f.write(json.dumps(ta_task.export_data(),
+                                   separators=(',', ':')) + '\n')
+            f.close()
+            self.tw.execute_command(['import', f.name])
+            import_failed = False
+        except tlib.TaskWarriorException:
+            import_failed = True
+        finally:
+            f.close()
+            os.remove(f.name)
+        exported = self._export_by_uuid([t.get('uuid') for t in tasks])
+        results = []
+        for ta_task in tasks:
+            is_new = id(ta_task) in new_tasks
+            data = exported.get(ta_task.get('uuid'))
+            if data and (is_new or not import_failed):
+                ta_task.load_data(data)
+                results.append((ta_task, None))
+            elif not import_failed:
+                results.append((ta_task, tlib.TaskWarriorException(
+                    "Task " + ta_task.get('uuid') + " was not imported.")))
+            else:
+                # fall back to saving the task on its own to isolate errors
+                if is_new:
+                    ta_task.set_uuid(None)
+                try:
+                    ta_task.save()
+                    results.append((ta_task, None))
+                except tlib.TaskWarriorException as e:
+                    results.append((ta_task, e))
+        return results
+
+    def _export(self, pattern):
+        """ Returns the data 'task export' prints for the tasks matching
+            pattern. The command comes first, so that no word of pattern
+            is taken for a command.
+        """
+        return self._run_export(['export', '--'] + list(pattern))
+
+    def _export_by_uuid(self, uuids):
+        return dict((data['uuid'], data)
+                    for data in self._run_export(list(uuids) + ['export']))
+
+    def _run_export(self, args):
+        result = []
+        for line in self.tw.execute_command(args):
+            line = line.strip().strip(',')
+            if line.startswith('{'):
+                result.append(json.loads(line))
+        return result
+
+
+class TaskWarriorPool(object):
+    """ Hands out one TaskWarrior per data location, created on first use.
+        At most max_task_calls commands run at once on each data location.
+    """
+
+    def __init__(self, max_task_calls=4):
+        self.max_task_calls = max_task_calls
+        self._taskrc = None
+        self._warriors = {}
+        self._readers = {}
+        self._indexes = {}
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(data_location):
+        return os.path.abspath(os.path.expanduser(data_location))
+
+    def get(self, data_location):
+        key = self._key(data_location)
+        with self._lock:
+            if key not in self._warriors:
+                self._warriors[key] = self._create(data_location)
+            return self._warriors[key]
+
+    def _create(self, data_location):
+        """ Creates a TaskWarrior reading the UDAs from the generated
+            taskrc, or from config overrides if it cannot be written.
+        """
+        if self._taskrc is None:
+            self._taskrc = taskrc.generate() or ''
+        if self._taskrc:
+            tw = tlib.TaskWarrior(data_location=data_location,
+                                  taskrc_location=self._taskrc)
+        else:
+            tw = tlib.TaskWarrior(data_location=data_location)
+            for uda in uda_config_list:
+                tw.config.update({uda[0]: uda[1]})
+        limit_task_calls(tw, threading.BoundedSemaphore(self.max_task_calls))
+        return profiling.get_profiler().trace_task_warrior(tw)
+
+    def get_reader(self, data_location):
+        key = self._key(data_location)
+        with self._lock:
+            if key not in self._readers:
+                self._readers[key] = NativeReader(data_location)
+            return self._readers[key]
+
+    def get_database(self, path):
+        from tarenalib.sqlstore import SQLiteDatabase
+        key = self._key(path)
+        with self._lock:
+            if key not in self._databases:
+                self._databases[key] = SQLiteDatabase(key)
+            return self._databases[key]
+
+    def get_index(self, data_location):
+        key = self._key(data_location)
+        with self._lock:
+            if key not in self._indexes:
+                self._indexes[key] = TaskIndex(data_location)
+            return self._indexes[key]
+
 
 class TaskArena(object):
     """ A project that is shared with others. """
 
-    def __init__(self, arena_name='', ldata='', rdata=''):
+    def __init__(self, arena_name='', ldata='', rdata='', pool=None):
         self._local_data = None
         self._remote_data = None
-        self.tw_local = None
-        self.tw_remote = None
+        self._tw_local = None
+        self._tw_remote = None
+        self._journal = None
+        self._writer_id = None
+        self.pool = pool if pool else TaskWarriorPool()
         self.name = arena_name
+        self.last_sync = ''
+        self.journal_position = None
+        self.reader = 'tasklib'
         self.local_data = ldata
         self.remote_data = rdata
 
+    @property
+    def base_file(self):
+        return os.path.join(os.path.expanduser(self.local_data),
+                            'arena_' + self.name + '.base.json')
+
+    @property
+    def journal_file(self):
+        """ The change journal of the arena, next to the remote tasks. """
+        from tarenalib import sqlstore
+        if sqlstore.is_sqlite_location(self.remote_data):
+            return sqlstore.sqlite_path(self.remote_data) + \
+                '.arena_' + self.name + '.journal'
+        return os.path.join(os.path.expanduser(self.remote_data),
+                            'arena_' + self.name + '.journal')
+
+    @property
+    def journal(self):
+        if self._journal is None and self.remote_data:
+            from tarenalib.journal import Journal
+            self._journal = Journal(self.journal_file)
+        return self._journal
+
+    @property
+    def writer_id(self):
+        """ Identifies the journal entries written by this client. """
+        if self._writer_id is None:
+            self._writer_id = str(uuid.uuid4())
+        return self._writer_id
+
     def get_local_data(self):
         return self._local_data
 
     def set_local_data(self, ldata):
         if ldata:
             self._local_data = ldata
-            self.tw_local = EnhancedTaskWarrior(
-                tlib.TaskWarrior(data_location=ldata),
-                self)
+            self._tw_local = None
 
     local_data = property(get_local_data, set_local_data)
 
@@ -199,12 +640,40 @@ class TaskArena(object):
     def set_remote_data(self, rdata):
         if rdata:
             self._remote_data = rdata
-            self.tw_remote = EnhancedTaskWarrior(
-                tlib.TaskWarrior(data_location=rdata),
-                self)
+            self._tw_remote = None
+            self._journal = None
 
     remote_data = property(get_remote_data, set_remote_data)
 
+    def _enhanced_task_warrior(self, data_location):
+        reader = self.pool.get_reader(data_location) \
+            if self.reader == 'native' else None
+        return EnhancedTaskWarrior(
+            None, self, reader, self.pool.get_index(data_location),
+            tw_factory=lambda: self.pool.get(data_location))
+
+    @property
+    def tw_local(self):
+        if self._tw_local is None and self.local_data:
+            self._tw_local = self._enhanced_task_warrior(self.local_data)
+        return self._tw_local
+
+    @property
+    def tw_remote(self):
+        """ The remote store, a TaskWarrior data location or a SQLite
+            database if remote_data is a sqlite:// URI.
+        """
+        if self._tw_remote is None and self.remote_data:
+            from tarenalib import sqlstore
+            if sqlstore.is_sqlite_location(self.remote_data):
+                self._tw_remote = sqlstore.SQLiteTaskStore(
+                    self.pool.get_database(
+                        sqlstore.sqlite_path(self.remote_data)), self)
+            else:
+                self._tw_remote = self._enhanced_task_warrior(
+                    self.remote_data)
+        return self._tw_remote
+
     def get_json(self):
         return self.__repr__()
 
@@ -212,29 +681,98 @@ class TaskArena(object):
         self.name = data['name']
         self.local_data = data['local_data']
         self.remote_data = data['remote_data']
+        self.last_sync = data.get('last_sync', '')
+        self.reader = data.get('reader', 'tasklib')
+        self.journal_position = data.get('journal_position')
+        self._writer_id = data.get('writer_id')
+        self._tw_local = None
+        self._tw_remote = None
+        self._journal = None
 
     json = property(get_json, set_json)
 
     def __repr__(self):
-        return {'name': self.name,
-                'local_data': self.local_data,
-                'remote_data': self.remote_data}
+        result = {'name': self.name,
+                  'local_data': self.local_data,
+                  'remote_data': self.remote_data}
+        if self.last_sync:
+            result['last_sync'] = self.last_sync
+        if self.reader != 'tasklib':
+            result['reader'] = self.reader
+        if self.journal_position:
+            result['journal_position'] = self.journal_position
+            result['writer_id'] = self.writer_id
+        return result
 
     def __str__(self):
         return str(self.__repr__())
 
-    def get_local_tasks(self, pattern=[]):
-        return self.tw_local.tasks(['Arena:' + self.name] + pattern)
+    @staticmethod
+    def modified_since_pattern(since):
+        return ['modified.after:' + since] if since else []
 
-    def get_remote_tasks(self, pattern=[]):
-        return self.tw_remote.tasks(['Arena:' + self.name] + pattern)
+    def get_local_tasks(self, pattern=[], since=None):
+        tasks = self.tw_local.tasks(['Arena:' + self.name] + pattern +
+                                    self.modified_since_pattern(since))
+        self.tw_local.index_tasks(tasks)
+        return tasks
+
+    def get_remote_tasks(self, pattern=[], since=None):
+        tasks = self.tw_remote.tasks(['Arena:' + self.name] + pattern +
+                                     self.modified_since_pattern(since))
+        self.tw_remote.index_tasks(tasks)
+        return tasks
+
+    def add_partners(self, local_tasks, remote_tasks):
+        """ Adds the tasks on either side whose partner on the other side
+            is among the given tasks.
+        """
+        local_ids = set(t.ArenaTaskID for t in local_tasks)
+        remote_ids = set(t.ArenaTaskID for t in remote_tasks)
+        local_partners, remote_partners = run_concurrently(
+            lambda: self.tw_local.tasks_by_arena_task_ids(
+                remote_ids - local_ids),
+            lambda: self.tw_remote.tasks_by_arena_task_ids(
+                local_ids - remote_ids))
+        return local_tasks + local_partners, remote_tasks + remote_partners
+
+    def save_indexes(self):
+        """ Saves the index entries fetching tasks has added on both sides.
+        """
+        for tw in (self._tw_local, self._tw_remote):
+            if tw is not None and tw.index is not None:
+                tw.index.save()
+
+    @staticmethod
+    def sync_timestamp():
+        return datetime.datetime.utcnow().strftime(tlib.DATE_FORMAT)
+
+    def sync_watermark(self, started, remote_tasks):
+        """ Returns the time the next sync looks for modified tasks from:
+            the newest modification among remote_tasks, the tasks found
+            modified since the last sync, if earlier than the start of the
+            sync, less sync_margin. The remote modification times come from
+            the clocks of whoever wrote the tasks, so changes they make later
+            are not missed when our clock is ahead. The watermark never moves
+            back before the last sync.
+        """
+        newest = max((t.last_modified() for t in remote_tasks), default='')
+        watermark = datetime.datetime.strptime(
+            min(started, newest) if newest else started, tlib.DATE_FORMAT)
+        watermark = (watermark - sync_margin).strftime(tlib.DATE_FORMAT)
+        return max(watermark, self.last_sync or '')
 
 
 class TaskEmperor(object):
-    """ A class to handle all your TaskArenas """
+    """ A class to handle all your TaskArenas. The arenas are kept by name
+        and built from their config when they are first needed.
+    """
 
     def __init__(self):
-        self.arenas = []
+        self._entries = {}
+        self._arenas = {}
+        self._deleted = set()
+        self.pool = TaskWarriorPool()
 
     def load(self, f):
         try:
@@ -246,35 +784,85 @@ class TaskEmperor(object):
     def save(self, f):
         json.dump(self.json, f)
 
+    @property
+    def arenas(self):
+        return [self._hydrate(name) for name in self._entries]
+
+    @property
+    def names(self):
+        return list(self._entries)
+
+    def _hydrate(self, name):
+        arena = self._arenas.get(name)
+        if arena is None:
+            arena = TaskArena(pool=self.pool)
+            arena.json = self._entries[name]
+            self._arenas[name] = arena
+        return arena
+
     def get_json(self):
-        return {'arenas': [p.json for p in self.arenas]}
+        return {'arenas': [self._arenas[name].json if name in self._arenas
+                           else self._entries[name]
+                           for name in self._entries]}
 
     def set_json(self, data):
-        self.arenas = []
-        for json_project in data['arenas']:
-            arena = TaskArena()
-            arena.json = json_project
-            self.arenas.append(arena)
+        self._entries = dict((json_project['name'], json_project)
+                             for json_project in data['arenas'])
+        self._arenas = {}
+        self._deleted = set()
 
     json = property(get_json, set_json)
 
+    def changes(self):
+        """ Returns the config of the arenas created or changed since the
+            config has been loaded or saved, by name.
+        """
+        changes = {}
+        for name, arena in self._arenas.items():
+            json_project = arena.json
+            if json_project != self._entries[name]:
+                changes[name] = json_project
+        return changes
+
+    def merge_json(self, data):
+        """ Applies the changes of this TaskEmperor to config data that may
+            have been changed by others in the meantime.
+        """
+        changes = self.changes()
+        arenas = []
+        for json_project in data.get('arenas', []):
+            name = json_project['name']
+            if name not in self._deleted:
+                arenas.append(changes.pop(name, json_project))
+        arenas.extend(changes.values())
+        return {'arenas': arenas}
+
+    def mark_saved(self):
+        for name, arena in self._arenas.items():
+            self._entries[name] = arena.json
+        self._deleted = set()
+
     def __repr__(self):
         return {'arenas': [p.__repr__() for p in self.arenas]}
 
     def __str__(self):
         return str(self.__repr__())
 
-    def create_arena(self, arena_id, ldata, rdata):
-        if arena_id not in [p.name for p in self.arenas]:
-            arena = TaskArena(arena_id, ldata, rdata)
-            self.arenas.append(arena)
+    def create_arena(self, arena_id, ldata, rdata, reader='tasklib'):
+        if arena_id not in self._entries:
+            arena = TaskArena(arena_id, ldata, rdata, self.pool)
+            arena.reader = reader
+            self._entries[arena_id] = None
+            self._arenas[arena_id] = arena
+            self._deleted.discard(arena_id)
             return arena
 
     def delete_arena(self, arena):
         arena.tw_local.remove_tasks_matching_pattern('')
-        self.arenas.remove(arena)
+        del self._entries[arena.name]
+        self._arenas.pop(arena.name, None)
+        self._deleted.add(arena.name)
 
     def find(self, arena_name):
-        for arena in self.arenas:
-            if arena.name == arena_name:
-                return arena
+        if arena_name in self._entries:
+            return self._hydrate(arena_name)
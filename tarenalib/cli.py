@@ -19,43 +19,85 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
+# tasklib and the sync machinery are imported by the commands needing them,
+# so that short commands start quickly
 import click
-from tarenalib.arena import uda_config_list
+from tarenalib import commands
+from tarenalib import profiling
 from tarenalib.io import IOManager
-from tarenalib.sync import SyncManager
-import subprocess
-import locale
+from tarenalib.options import readers, sync_policies
 
 iom = IOManager()
 
 
-def execute_command(command_args):
-    p = subprocess.Popen(command_args,
-                         stdin=subprocess.PIPE,
-                         stdout=subprocess.PIPE,
-                         stderr=subprocess.PIPE,
-                         )
-    encoding = locale.getdefaultlocale()[1]
-    p.communicate(input='y\n'.encode(encoding))
+def get_task_emperor(ctx):
+    """ Loads the config once per command line. """
+    obj = ctx.find_root().ensure_object(dict)
+    if 'te' not in obj:
+        obj['te'] = iom.get_task_emperor()
+    return obj['te']
+
+
+def run_in_daemon(ctx, command, **args):
+    """ Runs command in the tarena daemon if one is running. Returns its
+        response, or None if the command has to be run in-process. Once the
+        daemon has got the command, it is never run again in-process.
+    """
+    if not ctx.find_root().ensure_object(dict).get('daemon'):
+        return None
+    from tarenalib.server import request, DaemonError
+    try:
+        response = request(iom.socket_name, dict(args, command=command))
+    except DaemonError as e:
+        raise click.ClickException(str(e))
+    if response is not None:
+        for msg, pre_blanks, post_blanks in response['messages']:
+            iom.send_message(msg, pre_blanks, post_blanks)
+    return response
 
 
 @click.group()
 @click.option('--file')
-def cli(file):
+@click.option('--verbose', is_flag=True,
+              help='Reports where the config is read from.')
+@click.option('--no-daemon', is_flag=True,
+              help='Runs the command in-process even if a daemon is running.')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True),
+              help='Writes timings of the command and its task calls to PROFILE.')
+@click.option('--profile-format', type=click.Choice(['json', 'trace']),
+              default='json',
+              help='json (plain list of spans) or trace (Trace Event Format '
+                   'for flame graph viewers).')
+@click.pass_context
+def cli(ctx, file, verbose, no_daemon, profile, profile_format):
     iom.configfile_name = file
+    iom.verbose = verbose
+    ctx.ensure_object(dict)['daemon'] = not no_daemon
+    if profile:
+        profiler = profiling.enable()
+        span = profiler.span(ctx.invoked_subcommand or 'tarena')
+        span.__enter__()
+
+        def dump_profile():
+            span.__exit__(None, None, None)
+            with open(profile, 'w') as f:
+                profiler.dump(f, profile_format)
+            profiling.disable()
+
+        ctx.call_on_close(dump_profile)
 
 
 @cli.command(help='Installs TaskArena.')
 def install():
-    for uda in uda_config_list:
-        execute_command(['task', 'config', uda[0], uda[1]])
+    from tarenalib import taskrc
+    taskrc.install()
     iom.send_message('Installation successful.')
 
 
 @cli.command(help='Uninstalls TaskArena.')
 def uninstall():
-    for uda in uda_config_list:
-        execute_command(['task', 'config', uda[0]])
+    from tarenalib import taskrc
+    taskrc.uninstall()
     iom.send_message('Uninstallation successful.')
 
 
@@ -63,10 +105,15 @@ def uninstall():
 @click.option('--name', prompt='Enter a name: ')
 @click.option('--ldata', prompt='Enter local data.location: ')
 @click.option('--rdata', prompt='Enter remote data.location: ')
-def create(name, ldata, rdata):
-    te = iom.get_task_emperor()
+@click.option('--reader', type=click.Choice(readers),
+              default='tasklib',
+              help='Read tasks via the task binary (tasklib) or directly '
+                   'from the data files (native).')
+@click.pass_context
+def create(ctx, name, ldata, rdata, reader):
+    te = get_task_emperor(ctx)
     if te:
-        if te.create_arena(name, ldata, rdata):
+        if te.create_arena(name, ldata, rdata, reader):
             iom.send_message("Arena " + name + " created.")
             iom.save_task_emperor(te)
         else:
@@ -75,20 +122,29 @@ def create(name, ldata, rdata):
 
 class FoundArena(object):
 
-    def __init__(self, arena, task_emperor, sync_manager):
+    def __init__(self, arena, task_emperor):
         self.arena = arena
         self.te = task_emperor
-        self.sm = sync_manager
+        self._sm = None
+
+    @property
+    def sm(self):
+        if self._sm is None:
+            from tarenalib.sync import SyncManager
+            self._sm = SyncManager(self.arena, iom)
+        return self._sm
 
 
 def find_arena(ctx, param, value):
-    te = iom.get_task_emperor()
+    te = get_task_emperor(ctx)
+    if not te:
+        return None
     arena = te.find(value)
     if not arena:
         iom.send_message("Arena " + value + " not found.")
         return None
     else:
-        return FoundArena(arena, te,  SyncManager(arena, iom))
+        return FoundArena(arena, te)
 
 
 @cli.command(help='Deletes ARENA.')
@@ -101,8 +157,11 @@ def delete(found_arena):
 
 
 @cli.command(help='Lists all arenas.')
-def arenas():
-    te = iom.get_task_emperor()
+@click.pass_context
+def arenas(ctx):
+    te = get_task_emperor(ctx)
+    if not te:
+        return
     if te.arenas:
         iom.send_message("The following arenas are available:", 1)
         for arena in te.arenas:
@@ -113,13 +172,23 @@ def arenas():
         iom.send_message("No arenas found.")
 
 
+def raise_daemon_error(response):
+    if response['error']:
+        raise click.ClickException(response['error'])
+
+
 @cli.command(help='Adds tasks matching PATTERN to ARENA.')
-@click.argument('found_arena', callback=find_arena)
+@click.argument('arena')
 @click.argument('pattern', nargs=-1)
-def add(found_arena, pattern):
-    if found_arena:
-        found_arena.arena.tw_local.add_tasks_matching_pattern(pattern)
-        iom.send_message("Tasks added.")
+@click.pass_context
+def add(ctx, arena, pattern):
+    response = run_in_daemon(ctx, 'add', arena=arena, pattern=list(pattern))
+    if response:
+        raise_daemon_error(response)
+        return
+    te = get_task_emperor(ctx)
+    if te:
+        commands.add_tasks(te, iom, arena, pattern)
 
 
 @cli.command(help='Removes tasks matching PATTERN from ARENA.')
@@ -131,29 +200,127 @@ def remove(found_arena, pattern):
         iom.send_message("Tasks removed from " + found_arena.arena.name + ".")
 
 
+def list_tasks(ctx, side, arena, pattern):
+    response = run_in_daemon(ctx, side, arena=arena, pattern=list(pattern))
+    if response:
+        raise_daemon_error(response)
+        return
+    te = get_task_emperor(ctx)
+    if te:
+        commands.list_tasks(te, iom, arena, side, pattern)
+
+
 @cli.command(help='Lists all local tasks matching PATTERN from ARENA.')
-@click.argument('found_arena', callback=find_arena)
+@click.argument('arena')
 @click.argument('pattern', nargs=-1)
-def local(found_arena, pattern):
-    if found_arena:
-        for task in found_arena.arena.get_local_tasks(list(pattern)):
-            iom.send_message(task.tw_task['description'])
+@click.pass_context
+def local(ctx, arena, pattern):
+    list_tasks(ctx, 'local', arena, pattern)
 
 
 @cli.command(help='Lists all remote tasks matching PATTERN from ARENA.')
-@click.argument('found_arena', callback=find_arena)
+@click.argument('arena')
 @click.argument('pattern', nargs=-1)
-def remote(found_arena, pattern):
-    if found_arena:
-        for task in found_arena.arena.get_remote_tasks(list(pattern)):
-            iom.send_message(task.tw_task['description'])
-
-
-@cli.command(help='Synchronizes ARENA')
-@click.argument('found_arena', callback=find_arena)
-def sync(found_arena):
-    if found_arena:
-        found_arena.sm.sync()
+@click.pass_context
+def remote(ctx, arena, pattern):
+    list_tasks(ctx, 'remote', arena, pattern)
+
+
+@cli.command(help='Synchronizes the arenas NAMES.')
+@click.argument('names', nargs=-1)
+@click.option('--all', 'all_arenas', is_flag=True,
+              help='Synchronizes all arenas.')
+@click.option('--full', is_flag=True,
+              help='Compares all tasks instead of those modified since the last sync.')
+@click.option('--jobs', default=4,
+              help='Number of arenas synchronized at the same time.')
+@click.option('--policy', type=click.Choice(sync_policies),
+              help='Syncs without asking, resolving conflicts by POLICY.')
+@click.option('--report', type=click.File('w'),
+              help='Writes a JSON report of the sync operations to REPORT.')
+@click.option('--stream', is_flag=True,
+              help='Checks and applies the sync operations in chunks.')
+@click.option('--chunk-size', default=500,
+              help='Number of sync operations per chunk with --stream.')
+@click.option('--diff-workers', type=int,
+              help='Compares the tasks of large arenas on DIFF_WORKERS '
+                   'processes, 0 for one per core.')
+@click.pass_context
+def sync(ctx, names, all_arenas, full, jobs, policy, report, stream,
+         chunk_size, diff_workers):
+    import json
+    if not names and not all_arenas:
+        raise click.UsageError("Give the NAMES of the arenas to sync, "
+                               "or --all.")
+    chunk_size = chunk_size if stream else None
+    # only syncs by policy can run in the daemon, as it cannot ask the user
+    response = run_in_daemon(ctx, 'sync', names=list(names),
+                             all_arenas=all_arenas, full=full, jobs=jobs,
+                             policy=policy, chunk_size=chunk_size,
+                             diff_workers=diff_workers) \
+        if policy else None
+    if response:
+        if report and 'report' in response:
+            json.dump(response['report'], report, indent=2)
+        raise_daemon_error(response)
+        return
+    te = get_task_emperor(ctx)
+    if not te:
+        return
+    sync_report, error = commands.sync(te, iom, names, all_arenas, full, jobs,
+                                       policy, chunk_size, diff_workers)
+    if report:
+        json.dump(sync_report, report, indent=2)
+    if error:
+        raise error
+
+
+@cli.command(help='Watches the data folders of the arenas NAMES, or of all '
+                  'arenas, and syncs the arenas whose tasks change.')
+@click.argument('names', nargs=-1)
+@click.option('--policy', type=click.Choice(sync_policies), default='newest',
+              help='Resolves conflicts by POLICY.')
+@click.option('--debounce', default=2.0,
+              help='Seconds without further changes before syncing.')
+@click.option('--poll', is_flag=True,
+              help='Polls the data files instead of using inotify, '
+                   'e.g. for folders on network shares.')
+@click.option('--interval', default=5.0,
+              help='Seconds between two polls.')
+@click.pass_context
+def watch(ctx, names, policy, debounce, poll, interval):
+    from tarenalib.watch import ArenaWatcher
+    te = get_task_emperor(ctx)
+    if not te:
+        return
+    arenas = [te.find(name) for name in names] if names else te.arenas
+    for name, arena in zip(names, arenas):
+        if not arena:
+            raise click.ClickException("Arena " + name + " not found.")
+    arena_watcher = ArenaWatcher(te, iom, arenas, policy, debounce,
+                                 poll=poll, interval=interval)
+    iom.send_message("Watching " + ', '.join(arena_watcher.directories) +
+                     " (" + arena_watcher.watcher.__class__.__name__ + ").")
+    try:
+        arena_watcher.run()
+    except KeyboardInterrupt:
+        iom.send_message("Stopped.")
+    finally:
+        arena_watcher.watcher.close()
+
+
+@cli.command(help='Keeps the arenas loaded and serves the local, remote, '
+                  'add and sync commands of other tarena calls until '
+                  'interrupted.')
+def serve():
+    from tarenalib.server import serve as serve_forever, DaemonError
+    iom.send_message("Listening on " + iom.socket_name + ".")
+    try:
+        serve_forever(iom.socket_name, iom.configfile_name)
+    except DaemonError as e:
+        raise click.ClickException(str(e))
+    except KeyboardInterrupt:
+        iom.send_message("Stopped.")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+# The commands that can be run in-process as well as by the tarena daemon.
+# They talk to the user through the IOManager they are given.
+
+
+def list_tasks(te, iom, arena_name, side, pattern):
+    """ Sends the descriptions of the local or remote tasks of an arena
+        matching pattern.
+    """
+    arena = te.find(arena_name)
+    if not arena:
+        iom.send_message("Arena " + arena_name + " not found.")
+        return
+    try:
+        if side == 'local':
+            tasks = arena.get_local_tasks(list(pattern))
+        else:
+            tasks = arena.get_remote_tasks(list(pattern))
+    except ValueError as e:
+        # filters a store cannot evaluate, e.g. a SQLite store
+        iom.send_message(str(e))
+        return
+    for task in tasks:
+        iom.send_message(task.get('description'))
+
+
+def add_tasks(te, iom, arena_name, pattern):
+    arena = te.find(arena_name)
+    if not arena:
+        iom.send_message("Arena " + arena_name + " not found.")
+        return
+    arena.tw_local.add_tasks_matching_pattern(list(pattern))
+    iom.send_message("Tasks added.")
+
+
+def sync(te, iom, names, all_arenas=False, full=False, jobs=4, policy=None,
+         chunk_size=None, diff_workers=None):
+    """ Syncs the arenas names, or all arenas, and saves the config. Returns
+        the report of the sync and the error of the arena if only one arena
+        has been synced.
+    """
+    from tarenalib.sync import SyncManager, SyncIOManager, sync_arenas
+    if all_arenas:
+        arenas = te.arenas
+    else:
+        arenas = []
+        for name in names:
+            arena = te.find(name)
+            if arena:
+                arenas.append(arena)
+            else:
+                iom.send_message("Arena " + name + " not found.")
+    results = sync_arenas([SyncManager(arena, iom, diff_workers)
+                           for arena in arenas],
+                          full, jobs, policy, chunk_size)
+    iom.save_task_emperor(te)
+    report = {'policy': policy,
+              'arenas': [dict(sm.report(),
+                              error=str(error) if error else None)
+                         for sm, error in results]}
+    if len(results) > 1:
+        SyncIOManager(iom).report_summaries(results)
+        return report, None
+    return report, results[0][1] if results else None
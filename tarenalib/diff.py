@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import gc
+import multiprocessing
+import os
+import zlib
+from tarenalib.arena import field_bits, normalize_exported_value, \
+    tw_attrs_editable
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# fewer matched pairs are diffed in-process, as starting the workers would
+# take longer than the diff
+min_pairs_per_process = 5000
+
+
+def snapshot(task):
+    """ The editable fields of a SharedTask as sent to the workers. They are
+        not normalized yet, so that the workers do that part of the diff.
+    """
+    data = task.exported_fields()
+    return tuple(map(data.get, tw_attrs_editable))
+
+
+def diff_snapshots(pairs):
+    """ Returns (ArenaTaskID, field mask) for each (ArenaTaskID, local
+        snapshot, remote snapshot) in pairs whose fields differ.
+    """
+    result = []
+    for arena_task_id, local, remote in pairs:
+        mask = 0
+        for field, lvalue, rvalue in zip(tw_attrs_editable, local, remote):
+            if lvalue != rvalue and \
+                    normalize_exported_value(field, lvalue) != \
+                    normalize_exported_value(field, rvalue):
+                mask |= field_bits[field]
+        if mask:
+            result.append((arena_task_id, mask))
+    return result
+
+
+def shard(arena_task_id, shards):
+    return zlib.crc32(str(arena_task_id).encode('utf-8')) % shards
+
+
+def diff_in_processes(pairs, workers=None):
+    """ Diffs the matched (local, remote) SharedTasks in pairs on a pool of
+        worker processes, sharded by ArenaTaskID. Only the raw field values
+        are sent, the workers normalize them. Returns a dict of the field
+        masks of the pairs whose fields differ.
+    """
+    workers = workers or os.cpu_count() or 1
+    shards = [[] for _ in range(workers)]
+    # the snapshots cannot form cycles, collecting garbage while they are
+    # built would only scan all tasks again and again
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for ltask, rtask in pairs:
+            arena_task_id = ltask.ArenaTaskID
+            shards[shard(arena_task_id, workers)].append(
+                (arena_task_id, snapshot(ltask), snapshot(rtask)))
+    finally:
+        if gc_enabled:
+            gc.enable()
+    # forked workers could inherit locks held by other threads
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        'forkserver' if 'forkserver' in methods else 'spawn')
+    # the same goes for unpickling them in the workers, which only live
+    # for this diff
+    with context.Pool(workers, initializer=gc.disable) as pool:
+        results = pool.map(diff_snapshots, shards)
+    return dict(item for result in results for item in result)
+
+
+def diff_pairs(pairs):
+    """ Diffs the matched (local, remote) SharedTasks in pairs. Returns the
+        field masks of the pairs whose fields differ and, where known,
+        whether their local task is at least as new as the remote one, both
+        by ArenaTaskID. With numpy, the pairs are compared column by column,
+        otherwise pair by pair.
+    """
+    if numpy is None:
+        masks = {}
+        for ltask, rtask in pairs:
+            mask = ltask.different_fields_mask(rtask)
+            if mask:
+                masks[ltask.ArenaTaskID] = mask
+        return masks, {}
+    local = ArenaColumns([ltask for ltask, rtask in pairs])
+    remote = ArenaColumns([rtask for ltask, rtask in pairs])
+    masks, local_newer = diff_columns(local, remote)
+    masks = dict((arena_task_id, mask) for arena_task_id, mask
+                 in zip(local.ids, masks) if mask)
+    return masks, dict((arena_task_id, newer) for arena_task_id, newer
+                       in zip(local.ids, local_newer)
+                       if arena_task_id in masks)
+
+
+class ArenaColumns(object):
+    """ The editable fields of a list of tasks, one column of normalized
+        values per field, plus a column of their last modification times.
+        With numpy, the columns hold hashes of the values, which fit into
+        arrays of fixed width.
+    """
+
+    def __init__(self, tasks):
+        value = hash if numpy is not None else str
+        self.ids = [task.ArenaTaskID for task in tasks]
+        self.columns = [[value(task.get(field)) for task in tasks]
+                        for field in tw_attrs_editable]
+        self.modified = [task.last_modified() for task in tasks]
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def diff_columns(local, remote):
+    """ Compares the ArenaColumns of matched local and remote tasks, which
+        are aligned by ArenaTaskID. Returns the field mask of each pair and
+        whether its local task is at least as new as the remote one.
+    """
+    if numpy is not None and len(local):
+        differ = numpy.array(local.columns, dtype=numpy.int64) != \
+            numpy.array(remote.columns, dtype=numpy.int64)
+        bits = numpy.array([field_bits[field]
+                            for field in tw_attrs_editable], dtype=numpy.int64)
+        masks = bits.dot(differ)
+        local_newer = numpy.array(local.modified) >= \
+            numpy.array(remote.modified)
+        return masks.tolist(), local_newer.tolist()
+    masks = [0] * len(local)
+    for field, lcolumn, rcolumn in zip(tw_attrs_editable, local.columns,
+                                       remote.columns):
+        bit = field_bits[field]
+        for i, (lvalue, rvalue) in enumerate(zip(lcolumn, rcolumn)):
+            if lvalue != rvalue:
+                masks[i] |= bit
+    local_newer = [lmodified >= rmodified for lmodified, rmodified
+                   in zip(local.modified, remote.modified)]
+    return masks, local_newer
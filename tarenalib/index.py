@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import json
+import os
+import tempfile
+import threading
+
+index_filename = 'arena.index.json'
+
+
+class TaskIndex(object):
+    """ Maps the ArenaTaskIDs of the tasks in a data location to their uuid
+        and modification time, per arena. The index is a cache: tasks
+        changed by other means than TaskArena may be missing or out of date.
+    """
+
+    def __init__(self, data_location):
+        self.filename = os.path.join(os.path.expanduser(data_location),
+                                     index_filename)
+        self._entries = None
+        self._lock = threading.RLock()
+        self.dirty = False
+
+    @property
+    def entries(self):
+        """ The entries by ArenaTaskID, by arena name. """
+        with self._lock:
+            if self._entries is None:
+                self._entries = {}
+                if os.path.isfile(self.filename):
+                    with open(self.filename, 'r') as f:
+                        try:
+                            entries = json.load(f)
+                        except ValueError:
+                            entries = {}
+                    # skips the entries of older versions, which were not
+                    # kept per arena
+                    self._entries = dict(
+                        (arena, arena_entries)
+                        for arena, arena_entries in entries.items()
+                        if isinstance(arena_entries, dict))
+            return self._entries
+
+    def __contains__(self, key):
+        arena, arena_task_id = key
+        return str(arena_task_id) in self.entries.get(arena, {})
+
+    def __len__(self):
+        return sum(len(arena_entries)
+                   for arena_entries in self.entries.values())
+
+    def get(self, arena, arena_task_id):
+        """ Returns the (uuid, modified) pair of an ArenaTaskID of arena or
+            None.
+        """
+        entry = self.entries.get(arena, {}).get(str(arena_task_id))
+        return tuple(entry) if entry else None
+
+    def set(self, arena, arena_task_id, task_uuid, modified):
+        with self._lock:
+            entry = [task_uuid, modified]
+            arena_entries = self.entries.setdefault(arena, {})
+            if arena_entries.get(str(arena_task_id)) != entry:
+                arena_entries[str(arena_task_id)] = entry
+                self.dirty = True
+
+    def discard(self, arena, arena_task_id):
+        with self._lock:
+            arena_entries = self.entries.get(arena, {})
+            if arena_entries.pop(str(arena_task_id), None) is not None:
+                self.dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            try:
+                fd, tmp_filename = tempfile.mkstemp(
+                    prefix=index_filename + '.',
+                    dir=os.path.dirname(self.filename))
+            except OSError:
+                # the index is only a cache and is written again next time
+                return
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self.entries, f)
+                os.replace(tmp_filename, self.filename)
+            except OSError:
+                os.remove(tmp_filename)
+                return
+            self.dirty = False
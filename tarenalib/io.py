@@ -18,16 +18,23 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
-from tarenalib.arena import TaskEmperor
+import contextlib
+import json
 import os
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 class IOManager(object):
 
-    def __init__(self, show_output=True, seplength=75, configfile_name=None):
+    def __init__(self, show_output=True, seplength=75, configfile_name=None,
+                 verbose=False):
         self.show_output = show_output
         self.seplength = seplength
         self.configfile_name = configfile_name
+        self.verbose = verbose
 
     @staticmethod
     def formatted_print(t):
@@ -60,6 +67,10 @@ class IOManager(object):
 
     configfile_name = property(_get_configfile_name, _set_configfile_name)
 
+    @property
+    def socket_name(self):
+        return self.configfile_name + ".sock"
+
     def send_message(self, msg, pre_blanks=0, post_blanks=0):
         if self.show_output:
             IOManager.newlines(pre_blanks)
@@ -69,26 +80,61 @@ class IOManager(object):
     def print_separator(self):
         self.send_message("-" * self.seplength)
 
+    @contextlib.contextmanager
+    def config_lock(self):
+        """ Holds an exclusive lock on the configfile where supported. """
+        if fcntl is None:
+            yield
+            return
+        with open(self.configfile_name + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_config(self):
+        try:
+            with open(self.configfile_name, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_config(self, te_json):
+        tmp_filename = self.configfile_name + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(te_json, f)
+        os.replace(tmp_filename, self.configfile_name)
+
     def get_task_emperor(self):
+        from tarenalib.arena import TaskEmperor
         te = TaskEmperor()
         if os.path.isfile(self.configfile_name):
             f = open(self.configfile_name, 'r')
-            self.send_message("Configfile found at: %s" % self.configfile_name)
+            if self.verbose:
+                self.send_message("Configfile found at: %s"
+                                  % self.configfile_name)
             if te.load(f):
-                self.send_message("Configfile loaded.")
+                if self.verbose:
+                    self.send_message("Configfile loaded.")
             else:
                 self.send_message("Configfile corrupt.")
+                f.close()
                 return None
+            f.close()
         else:
-            f = open(self.configfile_name, 'w+')
+            with self.config_lock():
+                if not os.path.isfile(self.configfile_name):
+                    self._write_config(te.json)
             self.send_message("New configfile created at: %s" % self.configfile_name)
-            te.save(f)
-            self.send_message("Configfile saved.")
-        f.close()
         return te
 
     def save_task_emperor(self, te):
-        f = open(self.configfile_name, 'w+')
-        te.save(f)
+        """ Writes the changes of te to the configfile, keeping the changes
+            others have saved since te has been loaded.
+        """
+        with self.config_lock():
+            data = self._read_config()
+            self._write_config(te.merge_json(data) if data else te.json)
+        te.mark_saved()
         self.send_message("Saved.")
-        f.close()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import contextlib
+import json
+import os
+import uuid
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class Journal(object):
+    """ An append-only log of the changes synced to the remote tasks of an
+        arena, one JSON object per line after a header naming the
+        generation of the journal. Positions in the journal are pairs of
+        generation and offset, offset 0 being the start of the generation.
+        Compacting the journal starts a new generation, which makes all
+        older positions invalid.
+    """
+
+    def __init__(self, filename, max_size=1024 * 1024):
+        self.filename = filename
+        self.max_size = max_size
+
+    @contextlib.contextmanager
+    def lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.filename + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def read(self, position):
+        """ Returns the entries after position and the position of the end
+            of the journal. The entries are None if position is not valid
+            in the current generation, and the position is None if there is
+            no journal yet.
+        """
+        try:
+            f = open(self.filename, 'rb')
+        except OSError:
+            return None, None
+        with f:
+            header = f.readline()
+            try:
+                generation = json.loads(header.decode('utf-8'))['generation']
+            except (ValueError, KeyError, TypeError):
+                return None, None
+            valid = position is not None and position[0] == generation and \
+                position[1] <= os.fstat(f.fileno()).st_size
+            offset = max(position[1], len(header)) if valid else len(header)
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        new_position = [generation, offset + end]
+        if not valid:
+            return None, new_position
+        try:
+            entries = [json.loads(line.decode('utf-8'))
+                       for line in data[:end].splitlines() if line.strip()]
+        except ValueError:
+            return None, new_position
+        return entries, new_position
+
+    def append(self, entries):
+        """ Appends entries, compacting the journal first if it has grown
+            larger than max_size.
+        """
+        if not entries:
+            return
+        data = b''.join(json.dumps(entry, separators=(',', ':'))
+                        .encode('utf-8') + b'\n' for entry in entries)
+        with self.lock():
+            try:
+                size = os.path.getsize(self.filename)
+            except OSError:
+                size = 0
+            if not size or size + len(data) > self.max_size:
+                self._start_generation()
+            with open(self.filename, 'ab') as f:
+                f.write(data)
+
+    def compact(self):
+        with self.lock():
+            self._start_generation()
+
+    def _start_generation(self):
+        header = json.dumps({'generation': str(uuid.uuid4())}) + '\n'
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            f.write(header)
+        os.replace(tmp_filename, self.filename)
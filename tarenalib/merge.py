@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import contextlib
+import json
+import os
+import tempfile
+from tarenalib.arena import tw_attrs_editable
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class BaseStore(object):
+    """ The field values of the tasks of an arena as of their last sync. """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._snapshots = None
+        # the ids of the snapshots set since they were read
+        self._changed = set()
+        self.dirty = False
+
+    @property
+    def snapshots(self):
+        if self._snapshots is None:
+            self._snapshots = self._read()
+        return self._snapshots
+
+    def _read(self):
+        if os.path.isfile(self.filename):
+            with open(self.filename, 'r') as f:
+                try:
+                    return json.load(f)
+                except ValueError:
+                    pass
+        return {}
+
+    @contextlib.contextmanager
+    def lock(self):
+        """ Holds an exclusive lock on the store where supported. """
+        if fcntl is None:
+            yield
+            return
+        with open(self.filename + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __contains__(self, arena_task_id):
+        return str(arena_task_id) in self.snapshots
+
+    def get(self, arena_task_id):
+        snapshot = self.snapshots.get(str(arena_task_id))
+        if snapshot is None:
+            return None
+        return dict((field, snapshot.get(field, ''))
+                    for field in tw_attrs_editable)
+
+    def set(self, task):
+        arena_task_id = str(task.ArenaTaskID)
+        self.snapshots[arena_task_id] = dict(
+            (field, value) for field, value in task.field_values().items()
+            if value)
+        self._changed.add(arena_task_id)
+        self.dirty = True
+
+    def save(self):
+        """ Writes the snapshots set since they were read on top of the
+            store as it is now, as another sync of the arena may have saved
+            it in the meantime.
+        """
+        if not self.dirty:
+            return
+        with self.lock():
+            snapshots = self._read()
+            for arena_task_id in self._changed:
+                snapshots[arena_task_id] = self.snapshots[arena_task_id]
+            fd, tmp_filename = tempfile.mkstemp(
+                prefix=os.path.basename(self.filename) + '.',
+                dir=os.path.dirname(os.path.abspath(self.filename)))
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(snapshots, f)
+                os.replace(tmp_filename, self.filename)
+            except OSError:
+                os.remove(tmp_filename)
+                raise
+        self._snapshots = snapshots
+        self._changed = set()
+        self.dirty = False
+
+
+class MergeResult(object):
+
+    def __init__(self, upload_fields, download_fields, conflicts):
+        self.upload_fields = upload_fields
+        self.download_fields = download_fields
+        self.conflicts = conflicts
+
+
+def merge(base, local_task, remote_task):
+    """ Compares both tasks field by field against base. Fields changed on
+        one side only are taken from that side, fields changed differently
+        on both sides are conflicts.
+    """
+    local_values = local_task.field_values()
+    remote_values = remote_task.field_values()
+    upload_fields = []
+    download_fields = []
+    conflicts = []
+    for field in tw_attrs_editable:
+        if local_values[field] == remote_values[field]:
+            continue
+        local_changed = local_values[field] != base[field]
+        remote_changed = remote_values[field] != base[field]
+        if local_changed and not remote_changed:
+            upload_fields.append(field)
+        elif remote_changed and not local_changed:
+            download_fields.append(field)
+        else:
+            conflicts.append(field)
+    return MergeResult(upload_fields, download_fields, conflicts)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import calendar
+import json
+import os
+import re
+import threading
+import time
+
+DATE_FORMAT = '%Y%m%dT%H%M%SZ'
+
+data_files = ['pending.data', 'completed.data']
+
+date_attrs = [
+    'due',
+    'end',
+    'entry',
+    'modified',
+    'scheduled',
+    'start',
+    'until',
+    'wait',
+]
+
+# attributes whose filters TaskWarrior evaluates as exact matches
+exact_filter_attrs = [
+    'Arena',
+    'ArenaTaskID',
+    'status',
+    'uuid',
+]
+
+line_regex = re.compile(r'^\[(.*)\]$')
+attr_regex = re.compile(r'(\S+?):"((?:[^"\\]|\\.)*)"')
+filter_regex = re.compile(r'^(\w+)(?:\.(after|before))?:(.*)$')
+
+
+class NativeReaderError(Exception):
+    pass
+
+
+def decode_value(raw):
+    try:
+        value = json.loads('"' + raw + '"')
+    except ValueError:
+        raise NativeReaderError("Unsupported value: " + raw)
+    return value.replace('&open;', '[').replace('&close;', ']') \
+        .replace('&dquot;', '"')
+
+
+def format_date(epoch):
+    return time.strftime(DATE_FORMAT, time.gmtime(int(epoch)))
+
+
+def parse_date(value):
+    try:
+        return calendar.timegm(time.strptime(value, DATE_FORMAT))
+    except ValueError:
+        raise NativeReaderError("Unsupported date: " + value)
+
+
+def parse_line(line):
+    """ Converts a line of a TaskWarrior data file into the dictionary that
+        'task export' would print for the task.
+    """
+    match = line_regex.match(line)
+    if not match:
+        raise NativeReaderError("Unsupported line: " + line)
+    data = {}
+    annotations = []
+    for key, raw in attr_regex.findall(match.group(1)):
+        value = decode_value(raw)
+        if key.startswith('annotation_'):
+            annotations.append({'entry': format_date(key[len('annotation_'):]),
+                                'description': value})
+        elif key in date_attrs:
+            data[key] = format_date(value)
+        elif key == 'tags':
+            data[key] = value.split(',') if value else []
+        else:
+            data[key] = value
+    if annotations:
+        data['annotations'] = sorted(annotations, key=lambda a: a['entry'])
+    return data
+
+
+def compile_filter(token):
+    """ Returns a predicate on exported task data for a filter token, or
+        raises NativeReaderError if the token cannot be evaluated here.
+    """
+    token = token.strip()
+    if token.startswith('(') and token.endswith(')'):
+        predicates = [compile_filter(t)
+                      for t in re.split(r'\s+or\s+', token[1:-1].strip())]
+        return lambda data: any(p(data) for p in predicates)
+    match = filter_regex.match(token)
+    if not match:
+        raise NativeReaderError("Unsupported filter: " + token)
+    attr, modifier, value = match.groups()
+    value = value.strip('\'"')
+    if modifier:
+        if attr not in date_attrs:
+            raise NativeReaderError("Unsupported filter: " + token)
+        limit = format_date(parse_date(value))
+        if modifier == 'after':
+            return lambda data: data.get(attr, '') > limit
+        return lambda data: attr in data and data[attr] < limit
+    if attr not in exact_filter_attrs:
+        raise NativeReaderError("Unsupported filter: " + token)
+    return lambda data: data.get(attr, '') == value
+
+
+class NativeReader(object):
+    """ Reads tasks directly from the data files of a TaskWarrior data
+        location. Parsed files are cached until they change on disk.
+    """
+
+    def __init__(self, data_location):
+        self.data_location = os.path.expanduser(data_location)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _read_file(self, filename):
+        path = os.path.join(self.data_location, filename)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return []
+        key = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            cached = self._cache.get(filename)
+            if cached and cached[0] == key:
+                return cached[1]
+        with open(path, 'r', encoding='utf-8') as f:
+            tasks = [parse_line(line.strip()) for line in f if line.strip()]
+        if filename == 'pending.data':
+            pending_id = 0
+            for data in tasks:
+                if data.get('status') in ('pending', 'waiting', 'recurring'):
+                    pending_id += 1
+                    data['id'] = pending_id
+        with self._lock:
+            self._cache[filename] = (key, tasks)
+        return tasks
+
+    def export(self, pattern=()):
+        if not os.path.isfile(os.path.join(self.data_location,
+                                           data_files[0])):
+            raise NativeReaderError("No TaskWarrior data files found in " +
+                                    self.data_location)
+        predicates = [compile_filter(token) for token in pattern]
+        result = []
+        for filename in data_files:
+            for data in self._read_file(filename):
+                if all(p(data) for p in predicates):
+                    result.append(dict(data))
+        return result
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Profiler(object):
+    """ Records nested timing spans and the task commands run meanwhile. """
+
+    def __init__(self):
+        self.spans = []
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def span(self, name, **args):
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self._local.depth = depth
+            with self._lock:
+                self.spans.append({'name': name,
+                                   'start': start - self._origin,
+                                   'duration': duration,
+                                   'depth': depth,
+                                   'thread': threading.current_thread().name,
+                                   'args': args})
+
+    def trace_task_warrior(self, tw):
+        """ Records every command tw executes as a 'task' span. """
+        execute_command = tw.execute_command
+
+        def traced_execute_command(args, *a, **kw):
+            with self.span('task', argv=[str(arg) for arg in args]):
+                return execute_command(args, *a, **kw)
+
+        tw.execute_command = traced_execute_command
+        return tw
+
+    def get_json(self):
+        return {'spans': sorted(self.spans, key=lambda s: s['start'])}
+
+    def get_trace(self):
+        """ The spans in the Trace Event Format, which chrome://tracing,
+            Perfetto and speedscope display as flame graphs.
+        """
+        threads = {}
+        events = []
+        for s in sorted(self.spans, key=lambda s: s['start']):
+            events.append({'name': s['name'],
+                           'ph': 'X',
+                           'ts': s['start'] * 1e6,
+                           'dur': s['duration'] * 1e6,
+                           'pid': os.getpid(),
+                           'tid': threads.setdefault(s['thread'],
+                                                     len(threads)),
+                           'args': s['args']})
+        return {'traceEvents': events}
+
+    def dump(self, f, trace_format='json'):
+        json.dump(self.get_trace() if trace_format == 'trace'
+                  else self.get_json(), f, indent=2)
+
+
+class NullProfiler(object):
+    """ Stands in for a Profiler while profiling is disabled. """
+
+    @contextmanager
+    def span(self, name, **args):
+        yield
+
+    def trace_task_warrior(self, tw):
+        return tw
+
+
+_profiler = NullProfiler()
+
+
+def get_profiler():
+    return _profiler
+
+
+def enable():
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable():
+    global _profiler
+    _profiler = NullProfiler()
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import threading
+from tarenalib import commands
+from tarenalib.io import IOManager
+
+# How long a client waits for a daemon to accept its connection
+connect_timeout = 1.0
+# How long a client waits for the next line of a response before it runs
+# the command itself. While a command runs, the daemon sends an empty line
+# every heartbeat_interval seconds.
+response_timeout = 10.0
+heartbeat_interval = 2.0
+
+
+class DaemonError(Exception):
+    pass
+
+
+def config_stamp(configfile_name):
+    try:
+        stat = os.stat(configfile_name)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class BufferedIOManager(IOManager):
+    """ Collects the messages of a command to send them to the client. """
+
+    def __init__(self, configfile_name=None, loaded_stamp=None):
+        super(BufferedIOManager, self).__init__(True, 75, configfile_name)
+        self.messages = []
+        self.loaded_stamp = loaded_stamp
+        self.saved_stamp = None
+
+    def send_message(self, msg, pre_blanks=0, post_blanks=0):
+        self.messages.append([msg, pre_blanks, post_blanks])
+
+    def save_task_emperor(self, te):
+        """ Saves te, and records the stamp of the configfile afterwards
+            if nobody else has changed it since it has been loaded, as te
+            then holds all that has been saved.
+        """
+        with self.config_lock():
+            unchanged = config_stamp(self.configfile_name) == \
+                self.loaded_stamp
+            data = self._read_config()
+            self._write_config(te.merge_json(data) if data else te.json)
+            if unchanged:
+                self.saved_stamp = config_stamp(self.configfile_name)
+        te.mark_saved()
+        self.send_message("Saved.")
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            message = json.loads(line.decode('utf-8'))
+        except ValueError:
+            response = {'messages': [], 'error': 'Invalid request.'}
+        else:
+            done = threading.Event()
+            heartbeat = threading.Thread(target=self.send_heartbeats,
+                                         args=(done,))
+            heartbeat.daemon = True
+            heartbeat.start()
+            try:
+                response = self.server.run_command(message)
+            finally:
+                done.set()
+                heartbeat.join()
+        self.wfile.write((json.dumps(response) + '\n').encode('utf-8'))
+
+    def send_heartbeats(self, done):
+        """ Tells the client that the command is still running. """
+        while not done.wait(heartbeat_interval):
+            try:
+                self.wfile.write(b'\n')
+            except OSError:
+                return
+
+
+class ArenaServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ Keeps the config and the TaskWarrior handles of the arenas loaded and
+        runs the commands sent to its socket one at a time.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_name, configfile_name):
+        self.configfile_name = configfile_name
+        self.iom = IOManager(False, configfile_name=configfile_name)
+        self.lock = threading.Lock()
+        self._te = None
+        self._config_stamp = None
+        socketserver.UnixStreamServer.__init__(self, socket_name,
+                                               RequestHandler)
+
+    def server_bind(self):
+        # only the user running the daemon may connect
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def task_emperor(self):
+        """ Returns the TaskEmperor, loaded again if the configfile has
+            changed since it has been loaded or saved by the daemon.
+        """
+        stamp = config_stamp(self.configfile_name)
+        if self._te is None or stamp != self._config_stamp:
+            self._te = self.iom.get_task_emperor()
+            self._config_stamp = config_stamp(self.configfile_name)
+        return self._te
+
+    def run_command(self, message):
+        response = {'messages': [], 'error': None}
+        command = message.get('command')
+        with self.lock:
+            iom = None
+            try:
+                te = self.task_emperor()
+                iom = BufferedIOManager(self.configfile_name,
+                                        self._config_stamp)
+                response['messages'] = iom.messages
+                if te is None:
+                    raise DaemonError("Configfile corrupt.")
+                if command in ('local', 'remote'):
+                    commands.list_tasks(te, iom, message['arena'], command,
+                                        message.get('pattern', []))
+                elif command == 'add':
+                    commands.add_tasks(te, iom, message['arena'],
+                                       message.get('pattern', []))
+                elif command == 'sync':
+                    report, error = commands.sync(
+                        te, iom, message.get('names', []),
+                        message.get('all_arenas', False),
+                        message.get('full', False),
+                        message.get('jobs', 4),
+                        message.get('policy'),
+                        message.get('chunk_size'),
+                        message.get('diff_workers'))
+                    response['report'] = report
+                    if error:
+                        response['error'] = str(error)
+                elif command != 'ping':
+                    raise DaemonError("Unknown command: " + str(command))
+            except Exception as e:
+                response['error'] = str(e) or e.__class__.__name__
+            if iom is not None and iom.saved_stamp:
+                self._config_stamp = iom.saved_stamp
+        return response
+
+
+def request(socket_name, message):
+    """ Sends message to the daemon listening on socket_name and returns its
+        response, or None if no daemon is running. Raises a DaemonError if
+        the daemon fails once the message has been sent, as it may already
+        be carrying out the command.
+    """
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(socket_name):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(connect_timeout)
+    try:
+        sock.connect(socket_name)
+    except OSError:
+        sock.close()
+        return None
+    with sock:
+        sock.settimeout(response_timeout)
+        try:
+            sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+            with sock.makefile('rb') as f:
+                line = f.readline()
+                while line == b'\n':
+                    line = f.readline()
+        except socket.timeout:
+            raise DaemonError("The tarena daemon stopped responding.")
+        except OSError as e:
+            raise DaemonError("Lost the connection to the tarena daemon: " +
+                              str(e))
+    if not line:
+        raise DaemonError("The tarena daemon closed the connection.")
+    return json.loads(line.decode('utf-8'))
+
+
+def stop(signum, frame):
+    raise SystemExit(0)
+
+
+def serve(socket_name, configfile_name):
+    """ Runs the daemon until it is interrupted. """
+    if os.path.exists(socket_name):
+        if request(socket_name, {'command': 'ping'}) is not None:
+            raise DaemonError("A tarena daemon is already listening on " +
+                              socket_name + ".")
+        os.remove(socket_name)
+    server = ArenaServer(socket_name, configfile_name)
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_name)
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+import tasklib.task as tlib
+from tarenalib.arena import SharedTask
+from tarenalib.native import NativeReaderError, compile_filter, format_date, \
+    parse_date
+
+scheme = 'sqlite://'
+
+schema = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    uuid TEXT PRIMARY KEY,
+    arena TEXT NOT NULL DEFAULT '',
+    arena_task_id TEXT NOT NULL DEFAULT '',
+    modified TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_arena_task_id ON tasks (arena, arena_task_id);
+CREATE INDEX IF NOT EXISTS tasks_arena_modified ON tasks (arena, modified);
+'''
+
+arena_regex = re.compile(r'^Arena:(.*)$')
+modified_after_regex = re.compile(r'^modified\.after:(.*)$')
+arena_task_ids_regex = re.compile(
+    r'^\(\s*ArenaTaskID:[^\s()]+(\s+or\s+ArenaTaskID:[^\s()]+)*\s*\)$')
+tag_regex = re.compile(r'^([+-])([^\s()]+)$')
+# attributes TaskWarrior matches from the left, so that project:Home also
+# matches Home.Garden
+left_match_regex = re.compile(r'^(description|priority|project):(.*)$')
+word_regex = re.compile(r'^[^\s:()]+$')
+
+
+def is_sqlite_location(data_location):
+    return str(data_location).startswith(scheme)
+
+
+def sqlite_path(data_location):
+    return os.path.abspath(os.path.expanduser(data_location[len(scheme):]))
+
+
+def compile_pattern(pattern):
+    """ Returns an SQL condition with its arguments and a list of
+        predicates on exported task data for the tokens of pattern that
+        cannot be expressed in SQL.
+    """
+    conditions = []
+    args = []
+    predicates = []
+    for token in pattern:
+        token = token.strip()
+        arena_match = arena_regex.match(token)
+        modified_match = modified_after_regex.match(token)
+        if arena_match:
+            conditions.append('arena = ?')
+            args.append(arena_match.group(1).strip('\'"'))
+        elif modified_match:
+            conditions.append('modified > ?')
+            args.append(format_date(parse_date(
+                modified_match.group(1).strip('\'"'))))
+        elif arena_task_ids_regex.match(token):
+            ids = re.findall(r'ArenaTaskID:([^\s()]+)', token)
+            conditions.append('arena_task_id IN (' +
+                              ', '.join('?' * len(ids)) + ')')
+            args.extend(ids)
+        else:
+            predicates.append(compile_predicate(token))
+    return ' AND '.join(conditions) or '1', args, predicates
+
+
+def compile_predicate(token):
+    """ Returns a predicate on exported task data for a filter token. Next
+        to the filters of the native reader, these are tags, bare words and
+        the attributes of left_match_regex. Raises ValueError for others.
+    """
+    try:
+        return compile_filter(token)
+    except NativeReaderError:
+        pass
+    tag_match = tag_regex.match(token)
+    left_match = left_match_regex.match(token)
+    if tag_match:
+        sign, tag = tag_match.groups()
+        if sign == '+':
+            return lambda data: tag in data.get('tags', [])
+        return lambda data: tag not in data.get('tags', [])
+    elif left_match:
+        attr, value = left_match.groups()
+        value = value.strip('\'"')
+        if not value:
+            return lambda data: not data.get(attr)
+        return lambda data: data.get(attr, '').startswith(value)
+    elif word_regex.match(token):
+        return lambda data: token in data.get('description', '') or any(
+            token in annotation.get('description', '')
+            for annotation in data.get('annotations', []))
+    raise ValueError("Filter not supported by the SQLite store: " + token)
+
+
+class SQLiteTask(tlib.Task):
+    """ A task read from a SQLite store. There is no TaskWarrior to look up
+        its dependencies in, so they only carry their uuids.
+    """
+
+    def deserialize_depends(self, raw_uuids):
+        tasks = set()
+        for task_uuid in (raw_uuids or '').split(','):
+            if task_uuid:
+                task = tlib.Task(self.warrior)
+                task._load_data({'uuid': task_uuid})
+                tasks.add(task)
+        return tasks
+
+
+class SQLiteDatabase(object):
+    """ A SQLite file holding the tasks of any number of arenas. """
+
+    def __init__(self, path):
+        self.path = path
+        self._connection = None
+        self.lock = threading.RLock()
+
+    @property
+    def connection(self):
+        with self.lock:
+            if self._connection is None:
+                connection = sqlite3.connect(self.path, timeout=30,
+                                             check_same_thread=False)
+                connection.executescript(schema)
+                self._connection = connection
+            return self._connection
+
+    def select(self, condition, args):
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT data FROM tasks WHERE ' + condition, args).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def lookup(self, arena_name, arena_task_id):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT uuid, modified FROM tasks '
+                'WHERE arena = ? AND arena_task_id = ?',
+                (arena_name, str(arena_task_id))).fetchone()
+
+    def upsert(self, rows):
+        """ Writes rows of (uuid, arena, arena_task_id, modified, data) in a
+            single transaction.
+        """
+        with self.lock:
+            with self.connection:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO tasks '
+                    '(uuid, arena, arena_task_id, modified, data) '
+                    'VALUES (?, ?, ?, ?, ?)', rows)
+
+    def close(self):
+        with self.lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class SQLiteTaskStore(object):
+    """ The tasks of an arena in a SQLite database, with the interface of
+        EnhancedTaskWarrior that syncing relies on.
+    """
+
+    index = None
+
+    def __init__(self, database, arena):
+        self.database = database
+        self.arena = arena
+
+    def tasks(self, pattern):
+        condition, args, predicates = compile_pattern(pattern)
+        return [SharedTask(arena=self.arena, data=data,
+                           loader=self._load_task)
+                for data in self.database.select(condition, args)
+                if all(p(data) for p in predicates)]
+
+    @staticmethod
+    def _load_task(data):
+        task = SQLiteTask(None)
+        task._load_data(data)
+        return task
+
+    def index_tasks(self, tasks):
+        pass
+
+    def lookup(self, arena_task_id):
+        return self.database.lookup(self.arena.name, arena_task_id)
+
+    def tasks_by_arena_task_ids(self, arena_task_ids, chunk_size=500):
+        arena_task_ids = [str(i) for i in arena_task_ids]
+        result = []
+        for start in range(0, len(arena_task_ids), chunk_size):
+            chunk = arena_task_ids[start:start + chunk_size]
+            result.extend(self.tasks([
+                'Arena:' + self.arena.name,
+                '(' + ' or '.join('ArenaTaskID:' + i for i in chunk) + ')'
+            ]))
+        return result
+
+    def add_task(self, task):
+        t = SharedTask(arena=self.arena, data={}, loader=self._load_task)
+        t.update(task)
+        return t
+
+    def save_tasks(self, tasks, chunk_size=500):
+        """ Saves tasks in one transaction per chunk. Returns a list of
+            (task, error) pairs in the order of tasks.
+        """
+        results = []
+        for start in range(0, len(tasks), chunk_size):
+            results.extend(self._upsert_tasks(tasks[start:start + chunk_size]))
+        return results
+
+    def _upsert_tasks(self, tasks):
+        now = datetime.datetime.utcnow().strftime(tlib.DATE_FORMAT)
+        rows = []
+        exported = []
+        for ta_task in tasks:
+            data = dict((key, value)
+                        for key, value in ta_task.export_data().items()
+                        if value not in (None, '', []))
+            data.setdefault('uuid', str(uuid.uuid4()))
+            data.setdefault('entry', now)
+            data.setdefault('status', 'pending')
+            data['modified'] = now
+            exported.append(data)
+            rows.append((data['uuid'], data.get('Arena', ''),
+                         data.get('ArenaTaskID', ''), now,
+                         json.dumps(data, separators=(',', ':'))))
+        try:
+            self.database.upsert(rows)
+        except sqlite3.Error as e:
+            return [(ta_task, e) for ta_task in tasks]
+        for ta_task, data in zip(tasks, exported):
+            ta_task.load_data(data)
+        return [(ta_task, None) for ta_task in tasks]
@@ -18,50 +18,179 @@
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from tarenalib.io import IOManager
+from tarenalib.arena import fields_to_mask, mask_to_fields, \
+    run_concurrently, tw_attrs_editable
+from tarenalib.diff import diff_in_processes, diff_pairs, \
+    min_pairs_per_process
+from tarenalib.merge import BaseStore, merge
+from tarenalib import profiling
+
+
+# actions and suggestions of a SyncElement, stored by their index
+sync_actions = ['', 'UPLOAD', 'DOWNLOAD', 'CONFLICT', 'MERGE', 'SKIP']
+action_codes = dict((action, i) for i, action in enumerate(sync_actions))
+
+
+def chunked(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def sync_arenas(sync_managers, full=False, jobs=4, policy=None,
+                chunk_size=None):
+    """ Syncs several arenas on a pool of at most jobs threads. Returns a list
+        of (sync_manager, error) pairs in the order of sync_managers.
+    """
+    def run(sm):
+        try:
+            if chunk_size:
+                sm.sync_stream(full, policy, chunk_size)
+            else:
+                sm.sync(full, policy)
+            return sm, None
+        except Exception as e:
+            return sm, e
+
+    if jobs <= 1 or len(sync_managers) <= 1:
+        return [run(sm) for sm in sync_managers]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(run, sync_managers))
 
 
 class SyncManager(object):
-    def __init__(self, arena, io_manager):
+    def __init__(self, arena, io_manager, diff_workers=None):
         self.arena = arena
         self.synclist = []
         self.siom = SyncIOManager(io_manager)
+        self._base = None
+        self.streamed_counts = {}
+        self.streamed_failures = []
+        self.journal_position = None
+        # the remote tasks fetched as modified, without their partners
+        self.modified_remote_tasks = []
+        # diffs large arenas on this many processes, 0 for one per core
+        self.diff_workers = diff_workers
+
+    @property
+    def base(self):
+        if self._base is None:
+            self._base = BaseStore(self.arena.base_file)
+        return self._base
 
     @property
     def synclist_not_skipped(self):
         return [e for e in self.synclist if e.suggestion != 'SKIP']
 
-    def generate_synclist(self, local_tasks, remote_tasks):
-        for ltask in local_tasks:
-            rtask = next((t for t in remote_tasks if t == ltask), None)
-            if rtask:
-                self.synclist.append(SyncElement(
-                    ltask,
-                    rtask,
-                    ltask.different_fields(rtask),
-                    'CONFLICT'))
-            else:
-                self.synclist.append(SyncElement(ltask, None, None, 'UPLOAD'))
+    @staticmethod
+    def index_tasks(tasks):
+        return {task.ArenaTaskID: task for task in tasks}
+
+    def diff_matched_tasks(self, local_tasks, remote_index):
+        """ Returns the field masks of the matched tasks whose fields differ
+            and, if known, whether their local task is at least as new as
+            the remote one. Large arenas are diffed on diff_workers
+            processes, all others in this one.
+        """
+        pairs = [(ltask, remote_index[ltask.ArenaTaskID])
+                 for ltask in local_tasks if ltask.ArenaTaskID in remote_index]
+        profiler = profiling.get_profiler()
+        workers = self.diff_workers or os.cpu_count() or 1
+        if self.diff_workers is not None and workers >= 2 and \
+                len(pairs) >= workers * min_pairs_per_process:
+            with profiler.span('diff', arena=self.arena.name,
+                               workers=workers):
+                return diff_in_processes(pairs, workers), {}
+        with profiler.span('diff', arena=self.arena.name):
+            return diff_pairs(pairs)
+
+    def iter_synclist(self, local_tasks, remote_tasks, chunk_size=None):
+        """ Yields the SyncElements of the arena one by one. local_tasks may
+            be any iterable and is diffed in chunks of chunk_size tasks, or
+            all at once without one. remote_tasks is iterated twice.
+        """
+        remote_index = self.index_tasks(remote_tasks)
+        local_ids = set()
+        chunks = chunked(local_tasks, chunk_size) if chunk_size \
+            else [list(local_tasks)]
+        for chunk in chunks:
+            masks, local_newer = self.diff_matched_tasks(chunk, remote_index)
+            for ltask in chunk:
+                ltask_id = ltask.ArenaTaskID
+                local_ids.add(ltask_id)
+                rtask = remote_index.get(ltask_id)
+                if rtask and ltask_id not in masks:
+                    if ltask_id not in self.base:
+                        self.base.set(ltask)
+                    continue
+                elif rtask:
+                    e = SyncElement(ltask, rtask, masks[ltask_id], 'CONFLICT')
+                    e.local_newer = local_newer.get(ltask_id)
+                    yield e
+                else:
+                    yield SyncElement(ltask, None, None, 'UPLOAD')
         for rtask in remote_tasks:
-            if rtask not in local_tasks:
-                self.synclist.append(SyncElement(None, rtask, None, 'DOWNLOAD'))
+            if rtask.ArenaTaskID not in local_ids:
+                yield SyncElement(None, rtask, None, 'DOWNLOAD')
+
+    def generate_synclist(self, local_tasks, remote_tasks):
+        self.synclist.extend(self.iter_synclist(local_tasks, remote_tasks))
+
+    def suggest(self, e):
+        """ Replaces the suggestion CONFLICT of e. Returns False if e does
+            not need to be synced.
+        """
+        if e.suggestion == 'CONFLICT':
+            if not e.fields_mask:
+                return False
+            if not self.suggest_merge(e):
+                e.conflict = True
+                local_newer = e.local_newer
+                if local_newer is None:
+                    local_newer = e.local_task.last_modified() >= \
+                        e.remote_task.last_modified()
+                if local_newer:
+                    e.suggestion = 'UPLOAD'
+                else:
+                    e.suggestion = 'DOWNLOAD'
+        return True
 
     def suggest_conflict_resolution(self):
-        simplified_synclist = []
-        for e in self.synclist:
-            if e.suggestion == 'CONFLICT':
-                if e.fields:
-                    if e.local_task.last_modified() >= e.remote_task.last_modified():
-                        e.suggestion = 'UPLOAD'
-                    else:
-                        e.suggestion = 'DOWNLOAD'
-                    simplified_synclist.append(e)
-            else:
-                simplified_synclist.append(e)
-        self.synclist = simplified_synclist
+        self.synclist = [e for e in self.synclist if self.suggest(e)]
+
+    def suggest_merge(self, e):
+        """ Resolves e field by field if a base version of the task is known
+            and no field has been changed differently on both sides.
+        """
+        base = self.base.get(e.local_task.ArenaTaskID)
+        if base is None:
+            return False
+        result = merge(base, e.local_task, e.remote_task)
+        if result.conflicts:
+            return False
+        e.upload_fields = result.upload_fields
+        e.download_fields = result.download_fields
+        if not e.download_fields:
+            e.suggestion = 'UPLOAD'
+        elif not e.upload_fields:
+            e.suggestion = 'DOWNLOAD'
+        else:
+            e.suggestion = 'MERGE'
+        return True
 
-    def carry_out_sync(self):
-        for elem in self.synclist:
+    def carry_out_sync(self, synclist=None):
+        uploads = []
+        downloads = []
+        for elem in self.synclist if synclist is None else synclist:
             if elem.action == 'UPLOAD':
                 if elem.remote_task:
                     elem.remote_task.update(elem.local_task)
@@ -69,7 +198,7 @@ class SyncManager(object):
                     elem.remote_task = self.arena.tw_remote.add_task(
                         elem.local_task)
                     elem.remote_task.ArenaTaskID = elem.local_task.ArenaTaskID
-                elem.remote_task.save()
+                uploads.append(elem)
             elif elem.action == 'DOWNLOAD':
                 if elem.local_task:
                     elem.local_task.update(elem.remote_task)
@@ -77,20 +206,234 @@ class SyncManager(object):
                     elem.local_task = self.arena.tw_local.add_task(
                         elem.remote_task)
                     elem.local_task.ArenaTaskID = elem.remote_task.ArenaTaskID
-                elem.local_task.save()
+                downloads.append(elem)
+            elif elem.action == 'MERGE':
+                elem.remote_task.update(elem.local_task, elem.upload_fields)
+                elem.local_task.update(elem.remote_task, elem.download_fields)
+                uploads.append(elem)
+                downloads.append(elem)
+        remote_results, local_results = run_concurrently(
+            lambda: self.arena.tw_remote.save_tasks(
+                [elem.remote_task for elem in uploads]),
+            lambda: self.arena.tw_local.save_tasks(
+                [elem.local_task for elem in downloads]))
+        for elem, (task, error) in zip(uploads, remote_results):
+            elem.error = error
+        for elem, (task, error) in zip(downloads, local_results):
+            elem.error = elem.error or error
+        for elem in uploads + downloads:
+            if not elem.error:
+                self.base.set(elem.local_task)
+        self.write_journal(uploads)
+
+    def journal_entry(self, elem, timestamp):
+        if elem.action == 'MERGE':
+            fields = elem.upload_fields
+        elif elem.fields is not None:
+            fields = elem.fields
+        else:
+            fields = tw_attrs_editable
+        values = elem.remote_task.field_values()
+        return {'t': timestamp, 'w': self.arena.writer_id,
+                'id': elem.remote_task.ArenaTaskID,
+                'f': dict((field, values[field]) for field in fields)}
+
+    def write_journal(self, uploads):
+        """ Appends the changes written to the remote tasks to the journal
+            of the arena.
+        """
+        timestamp = self.arena.sync_timestamp()
+        entries = [self.journal_entry(elem, timestamp)
+                   for elem in uploads if not elem.error]
+        try:
+            self.arena.journal.append(entries)
+        except OSError as e:
+            self.siom.iom.send_message(
+                "Could not write the journal of arena " + self.arena.name +
+                ": " + str(e) + ". Others should sync with --full.")
+
+    @property
+    def failed_elements(self):
+        return [e for e in self.synclist if e.error]
+
+    def apply_policy(self, policy):
+        """ Sets the actions of all elements without asking the user. """
+        for e in self.synclist:
+            if not e.conflict or policy == 'newest':
+                e.action = e.suggestion
+            elif policy == 'local-wins':
+                e.action = 'UPLOAD'
+            elif policy == 'remote-wins':
+                e.action = 'DOWNLOAD'
+            elif policy == 'skip-conflicts':
+                e.action = 'SKIP'
+            else:
+                raise ValueError("Unknown sync policy: " + policy)
+
+    def apply_synclist(self):
+        """ Returns True if the arena is in sync afterwards. """
+        with profiling.get_profiler().span('apply', arena=self.arena.name):
+            self.carry_out_sync()
+        failed = self.failed_elements
+        if failed:
+            self.siom.report_errors(failed)
+        self.siom.iom.send_message("Sync complete.", 1, 1)
+        return not failed and all(
+            e.action in ('UPLOAD', 'DOWNLOAD', 'MERGE')
+            for e in self.synclist)
 
     def process_user_modified_synclist(self):
-        self.synclist = self.siom.user_checks_synclist(self.synclist,
-                                                       self.arena.name)
+        """ Returns True if the arena is in sync afterwards. """
+        with profiling.get_profiler().span('user checks',
+                                           arena=self.arena.name):
+            synclist = self.siom.user_checks_synclist(self.synclist,
+                                                      self.arena.name)
+        if synclist is None:
+            return True
+        self.synclist = synclist
         if self.synclist:
-            self.carry_out_sync()
-            self.siom.iom.send_message("Sync complete.", 1, 1)
+            return self.apply_synclist()
+        return False
+
+    def process_synclist_with_policy(self, policy):
+        self.apply_policy(policy)
+        if not self.synclist:
+            self.siom.iom.send_message(
+                "Arena " + self.arena.name + " is in sync.")
+            return True
+        return self.apply_synclist()
+
+    def fetch_tasks(self, full=False):
+        profiler = profiling.get_profiler()
+        since = None if full else self.arena.last_sync or None
+
+        def fetch_local():
+            with profiler.span('fetch local', arena=self.arena.name):
+                return self.arena.get_local_tasks(since=since)
+
+        def fetch_remote():
+            with profiler.span('fetch remote', arena=self.arena.name):
+                return self.fetch_remote_tasks(since)
+
+        local_tasks, remote_tasks = run_concurrently(fetch_local,
+                                                     fetch_remote)
+        if since:
+            with profiler.span('fetch partners', arena=self.arena.name):
+                return self.arena.add_partners(local_tasks, remote_tasks)
+        return local_tasks, remote_tasks
+
+    def fetch_remote_tasks(self, since=None):
+        """ Returns the remote tasks changed by others since the last sync,
+            as recorded in the journal of the arena. Falls back to the
+            modification times if the journal cannot be used.
+        """
+        entries, self.journal_position = self.arena.journal.read(
+            self.arena.journal_position)
+        self.modified_remote_tasks = []
+        if not since or entries is None:
+            self.modified_remote_tasks = self.arena.get_remote_tasks(
+                since=since)
+            return self.modified_remote_tasks
+        writer_id = self.arena.writer_id
+        arena_task_ids = set(entry['id'] for entry in entries
+                             if entry['w'] != writer_id)
+        return self.arena.tw_remote.tasks_by_arena_task_ids(arena_task_ids)
 
-    def sync(self):
-        self.generate_synclist(self.arena.get_local_tasks(),
-                               self.arena.get_remote_tasks())
-        self.suggest_conflict_resolution()
-        self.process_user_modified_synclist()
+    def adopt_sync_state(self, watermark):
+        self.arena.last_sync = watermark
+        self.arena.journal_position = self.journal_position
+
+    def sync(self, full=False, policy=None):
+        """ Syncs the arena, asking the user to confirm the sync operations
+            unless a policy from options.sync_policies is given.
+        """
+        profiler = profiling.get_profiler()
+        with profiler.span('sync', arena=self.arena.name):
+            started = self.arena.sync_timestamp()
+            local_tasks, remote_tasks = self.fetch_tasks(full)
+            watermark = self.arena.sync_watermark(
+                started, self.modified_remote_tasks)
+            with profiler.span('generate', arena=self.arena.name):
+                self.generate_synclist(local_tasks, remote_tasks)
+            with profiler.span('suggest', arena=self.arena.name):
+                self.suggest_conflict_resolution()
+            if policy:
+                in_sync = self.process_synclist_with_policy(policy)
+            else:
+                in_sync = self.process_user_modified_synclist()
+            if in_sync:
+                self.adopt_sync_state(watermark)
+            self.base.save()
+            self.arena.save_indexes()
+
+    def sync_stream(self, full=False, policy=None, chunk_size=500):
+        """ Syncs the arena in chunks of chunk_size elements. The tasks of
+            both sides are still fetched in full, but each chunk of
+            elements is diffed, checked and written before the next one is
+            generated. Only failed elements are kept afterwards.
+        """
+        profiler = profiling.get_profiler()
+        with profiler.span('sync', arena=self.arena.name):
+            started = self.arena.sync_timestamp()
+            local_tasks, remote_tasks = self.fetch_tasks(full)
+            watermark = self.arena.sync_watermark(
+                started, self.modified_remote_tasks)
+            elements = (e for e in self.iter_synclist(local_tasks,
+                                                      remote_tasks,
+                                                      chunk_size)
+                        if self.suggest(e))
+            in_sync = True
+            for chunk in chunked(elements, chunk_size):
+                if policy:
+                    self.synclist = chunk
+                    self.apply_policy(policy)
+                else:
+                    with profiler.span('user checks', arena=self.arena.name):
+                        self.synclist = self.siom.user_checks_synclist(
+                            chunk, self.arena.name)
+                    if not self.synclist:
+                        in_sync = False
+                        break
+                with profiler.span('apply', arena=self.arena.name):
+                    self.carry_out_sync()
+                failed = self.failed_elements
+                if failed:
+                    self.siom.report_errors(failed)
+                in_sync = in_sync and not failed and all(
+                    e.action in ('UPLOAD', 'DOWNLOAD', 'MERGE')
+                    for e in self.synclist)
+                self.count_actions(self.synclist, self.streamed_counts)
+                self.streamed_failures.extend(failed)
+                self.synclist = []
+            if self.streamed_counts:
+                self.siom.iom.send_message("Sync complete.", 1, 1)
+            else:
+                self.siom.iom.send_message(
+                    "Arena " + self.arena.name + " is in sync.")
+            if in_sync:
+                self.adopt_sync_state(watermark)
+            self.base.save()
+            self.arena.save_indexes()
+
+    def report(self):
+        return {
+            'arena': self.arena.name,
+            'last_sync': self.arena.last_sync,
+            'summary': self.summary(),
+            'elements': [e.report() for e in
+                         self.streamed_failures + self.synclist],
+        }
+
+    def summary(self):
+        return self.count_actions(self.synclist, dict(self.streamed_counts))
+
+    @staticmethod
+    def count_actions(elements, counts=None):
+        counts = {} if counts is None else counts
+        for e in elements:
+            key = 'FAILED' if e.error else e.action or 'SKIP'
+            counts[key] = counts.get(key, 0) + 1
+        return counts
 
     def __repr__(self):
         return str({'arena:': self.arena.__str__(),
@@ -101,7 +444,35 @@ class SyncManager(object):
                     'synclist:': [e.__str__() for e in self.synclist]})
 
 
+def action_code(action):
+    try:
+        return action_codes[action or '']
+    except KeyError:
+        raise ValueError("Unknown sync action: " + str(action))
+
+
+def fields_property(name):
+    """ A property that stores a list of task fields as a field mask, or
+        None. Field masks are accepted as values as well.
+    """
+    def getter(self):
+        mask = getattr(self, name)
+        return None if mask is None else mask_to_fields(mask)
+
+    def setter(self, value):
+        if value is None or isinstance(value, int):
+            setattr(self, name, value)
+        else:
+            setattr(self, name, fields_to_mask(value))
+
+    return property(getter, setter)
+
+
 class SyncElement(object):
+    __slots__ = ('local_task', 'remote_task', '_suggestion', '_action',
+                 '_fields', '_upload_fields', '_download_fields', 'conflict',
+                 'local_newer', 'error')
+
     def __init__(self, ltask=None, rtask=None, fields=None, suggestion='',
                  action=''):
         self.local_task = ltask
@@ -109,23 +480,65 @@ class SyncElement(object):
         self.suggestion = suggestion
         self.action = action
         self.fields = fields
+        self._upload_fields = None
+        self._download_fields = None
+        self.conflict = False
+        # whether local_task is at least as new as remote_task, if known
+        self.local_newer = None
+        self.error = None
+
+    def _get_suggestion(self):
+        return sync_actions[self._suggestion]
+
+    def _set_suggestion(self, value):
+        self._suggestion = action_code(value)
+
+    suggestion = property(_get_suggestion, _set_suggestion)
+
+    def _get_action(self):
+        return sync_actions[self._action]
+
+    def _set_action(self, value):
+        self._action = action_code(value)
+
+    action = property(_get_action, _set_action)
+
+    fields = fields_property('_fields')
+    upload_fields = fields_property('_upload_fields')
+    download_fields = fields_property('_download_fields')
+
+    @property
+    def fields_mask(self):
+        return self._fields or 0
 
     @property
     def local_description(self):
-        return self.local_task.tw_task['description'] if self.local_task else ''
+        return self.local_task.get('description') if self.local_task else ''
 
     @property
     def remote_description(self):
-        return self.remote_task.tw_task[
-            'description'] if self.remote_task else ''
+        return self.remote_task.get('description') if self.remote_task \
+            else ''
 
     @property
     def local_last_modified(self):
-        return str(self.local_task.last_modified()) if self.local_task else ''
+        return self.local_task.last_modified() if self.local_task else ''
 
     @property
     def remote_last_modified(self):
-        return str(self.remote_task.last_modified()) if self.remote_task else ''
+        return self.remote_task.last_modified() if self.remote_task else ''
+
+    def report(self):
+        task = self.local_task or self.remote_task
+        return {
+            'ArenaTaskID': str(task.ArenaTaskID) if task else '',
+            'description': self.local_description or self.remote_description,
+            'suggestion': self.suggestion,
+            'action': self.action,
+            'conflict': self.conflict,
+            'fields': self.fields or [],
+            'error': str(self.error) if self.error else None,
+        }
 
     def __repr__(self):
         return {'local_task': self.local_task.__repr__(),
@@ -143,6 +556,10 @@ class SyncElement(object):
 
 
 class SyncIOManager(object):
+    # shared by all arenas synced at the same time, so that only one of them
+    # talks to the user at any time
+    prompt_lock = threading.RLock()
+
     def __init__(self, iom):
         self.iom = iom
 
@@ -169,10 +586,16 @@ class SyncIOManager(object):
             1
         )
 
+    @staticmethod
+    def is_uploaded(e, field):
+        if e.suggestion == 'MERGE':
+            return field in e.upload_fields
+        return e.suggestion == 'UPLOAD'
+
     def sync_choice(self, e):
         if e.local_task:
             self.iom.send_message(
-                "Task Description: " + e.local_task.tw_task['description']
+                "Task Description: " + e.local_task.get('description')
             )
             self.iom.send_message(
                 "ArenaTaskID     : " + e.local_task.ArenaTaskID
@@ -194,18 +617,21 @@ class SyncIOManager(object):
                     "This would cause the following modifications:", 0, 1
                 )
                 for field in e.fields:
-                    local_field = str(e.local_task.tw_task[field]) \
-                        if e.local_task.tw_task[field] else '(empty)'
-                    remote_field = str(e.remote_task.tw_task[field]) \
-                        if e.remote_task.tw_task[field] else '(empty)'
+                    local_field = e.local_task.get(field) or '(empty)'
+                    remote_field = e.remote_task.get(field) or '(empty)'
                     self.iom.send_message(
                         field + ": " + local_field +
-                        (" -> " if e.suggestion == 'UPLOAD' else ' <- ') +
+                        (" -> " if self.is_uploaded(e, field) else ' <- ') +
                         remote_field
                     )
-                result = IOManager.get_input(
-                    "Do you want to (u)pload, (d)ownload, (s)kip or (c)ancel sync? (u/d/s/c) ",
-                    1)
+                if e.suggestion == 'MERGE':
+                    result = IOManager.get_input(
+                        "Do you want to (m)erge, (u)pload, (d)ownload, (s)kip or (c)ancel sync? (m/u/d/s/c) ",
+                        1)
+                else:
+                    result = IOManager.get_input(
+                        "Do you want to (u)pload, (d)ownload, (s)kip or (c)ancel sync? (u/d/s/c) ",
+                        1)
             else:
                 self.iom.send_message(
                     "This task does not yet exist on remote. Suggestion: " + e.suggestion,
@@ -216,7 +642,7 @@ class SyncIOManager(object):
         elif e.remote_task:
             self.iom.print_separator()
             self.iom.send_message(
-                "Description: " + e.remote_task.tw_task['description'])
+                "Description: " + e.remote_task.get('description'))
             self.iom.send_message("ArenaTaskID: " + e.remote_task.ArenaTaskID)
             self.iom.send_message("This task does not yet exist on local.", 1)
             result = IOManager.get_input(
@@ -226,7 +652,32 @@ class SyncIOManager(object):
             result = None
         return result
 
+    def report_errors(self, failed):
+        self.iom.send_message(
+            str(len(failed)) + " task(s) could not be synced:", 1)
+        for e in failed:
+            self.iom.send_message(
+                (e.local_description or e.remote_description) + ": " +
+                str(e.error))
+
+    def report_summaries(self, results):
+        self.iom.print_separator()
+        for sm, error in results:
+            if error:
+                summary = "failed (" + str(error) + ")"
+            else:
+                summary = ', '.join(
+                    str(count) + ' ' + action.lower()
+                    for action, count in sorted(sm.summary().items())
+                ) or 'in sync'
+            self.iom.send_message(sm.arena.name + ": " + summary)
+        self.iom.print_separator()
+
     def user_checks_synclist(self, synclist, arena_name):
+        with self.prompt_lock:
+            return self._user_checks_synclist(synclist, arena_name)
+
+    def _user_checks_synclist(self, synclist, arena_name):
         if synclist:
             self.iom.send_message(
                 "Suggesting the following sync operations on " +
@@ -247,6 +698,9 @@ class SyncIOManager(object):
                     elif sc == 'd':
                         elem.action = 'DOWNLOAD'
                         self.iom.send_message("Task will be downloaded.", 1)
+                    elif sc == 'm' and elem.suggestion == 'MERGE':
+                        elem.action = 'MERGE'
+                        self.iom.send_message("Task will be merged.", 1)
                     elif sc == 's':
                         elem.action = 'SKIP'
                         self.iom.send_message("Task skipped.", 1)
@@ -254,6 +708,9 @@ class SyncIOManager(object):
                         self.iom.send_message("Sync canceled.", 0, 1)
                         synclist = []
                         break
+            else:
+                self.iom.send_message("Sync canceled.", 0, 1)
+                synclist = []
             return synclist
         else:
             self.iom.send_message("Arena " + arena_name + " is in sync.")
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import tempfile
+
+uda_config_list = [
+    ['uda.Arena.type', 'string'],
+    ['uda.Arena.label', 'Arena'],
+    ['uda.ArenaTaskID.type', 'string'],
+    ['uda.ArenaTaskID.label', 'ArenaTaskID'],
+]
+
+# holds the UDA definitions, included by the user's taskrc after install
+uda_file = '~/.task_arena.rc'
+# the taskrc that tarena runs task with
+arena_taskrc = '~/.task_arena.taskrc'
+
+header = '# Generated by TaskArena, do not edit.\n'
+
+
+def user_taskrc():
+    return os.path.expanduser(os.environ.get('TASKRC', '~/.taskrc'))
+
+
+def include_line(filename):
+    return 'include ' + os.path.abspath(os.path.expanduser(filename)) + '\n'
+
+
+def uda_file_content():
+    return header + ''.join(key + '=' + value + '\n'
+                            for key, value in uda_config_list)
+
+
+def arena_taskrc_content():
+    lines = [header]
+    if os.path.isfile(user_taskrc()):
+        lines.append(include_line(user_taskrc()))
+    lines.append(include_line(uda_file))
+    return ''.join(lines)
+
+
+def write_file(filename, content):
+    """ Writes content to filename unless it is there already. """
+    filename = os.path.expanduser(filename)
+    try:
+        with open(filename, 'r') as f:
+            if f.read() == content:
+                return
+    except OSError:
+        pass
+    # a temporary file of its own, as other tarena processes may be
+    # writing the same file
+    fd, tmp_filename = tempfile.mkstemp(
+        prefix=os.path.basename(filename) + '.',
+        dir=os.path.dirname(os.path.abspath(filename)))
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(content)
+        os.replace(tmp_filename, filename)
+    except OSError:
+        os.remove(tmp_filename)
+        raise
+
+
+def generate():
+    """ Writes the UDA definitions and the taskrc for tarena's own task
+        calls. Returns the location of the taskrc, or None if it could not
+        be written.
+    """
+    try:
+        write_file(uda_file, uda_file_content())
+        write_file(arena_taskrc, arena_taskrc_content())
+    except OSError:
+        return None
+    return os.path.expanduser(arena_taskrc)
+
+
+def is_installed():
+    try:
+        with open(user_taskrc(), 'r') as f:
+            return include_line(uda_file) in \
+                [line.rstrip('\n') + '\n' for line in f]
+    except OSError:
+        return False
+
+
+def install():
+    """ Makes the user's taskrc include the UDA definitions. """
+    write_file(uda_file, uda_file_content())
+    if is_installed():
+        return
+    with open(user_taskrc(), 'a+') as f:
+        f.seek(0)
+        content = f.read()
+        f.write('\n' if content and not content.endswith('\n') else '')
+        f.write(include_line(uda_file))
+
+
+def is_arena_line(line):
+    key = line.split('=', 1)[0].strip()
+    return line.rstrip('\n') + '\n' == include_line(uda_file) or \
+        any(key == uda[0] for uda in uda_config_list)
+
+
+def uninstall():
+    """ Removes the include of the UDA definitions from the user's taskrc,
+        as well as UDA definitions written there by older versions.
+    """
+    try:
+        with open(user_taskrc(), 'r+') as f:
+            lines = f.readlines()
+            kept = [line for line in lines if not is_arena_line(line)]
+            if kept != lines:
+                f.seek(0)
+                f.write(''.join(kept))
+                f.truncate()
+    except OSError:
+        pass
@@ -17,3 +17,14 @@
 # You should have received a copy of the GNU General Public License along
 # with this program; if not, write to the Free Software Foundation, Inc.,
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+from unittest.mock import patch
+
+
+def patch_taskrc(test_case):
+    """ Lets the TaskWarriors created in test_case use a dummy taskrc
+        instead of generating the real one, until the test has finished.
+    """
+    patcher = patch('tarenalib.taskrc.generate', return_value='taskrc')
+    patcher.start()
+    test_case.addCleanup(patcher.stop)
@@ -18,11 +18,17 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
+import json
+import threading
+import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from io import StringIO
 
-from tarenalib.arena import TaskEmperor, TaskArena, EnhancedTaskWarrior, SharedTask, tw_attrs_editable
+from tarenalib.arena import TaskEmperor, TaskArena, EnhancedTaskWarrior, SharedTask, tw_attrs_editable, \
+    TaskWarriorPool
+from tarenalib.index import TaskIndex
+from tarenalib.tests import patch_taskrc
 import tasklib.task as tlib
 
 
@@ -33,6 +39,7 @@ class TestSharedTask(unittest.TestCase):
         self.MockClass1 = self.patcher1.start()
         self.patcher2 = patch('tasklib.task.Task', new=dict)
         self.MockClass2 = self.patcher2.start()
+        patch_taskrc(self)
 
     def tearDown(self):
         self.patcher1.stop()
@@ -100,11 +107,28 @@ class TestSharedTask(unittest.TestCase):
         self.assertEqual(u'priority' in fields, True)
         self.assertEqual(u'due' in fields, False)
 
+    def test_exported_data_is_read_without_task(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        loader = MagicMock(side_effect=lambda data: dict(data))
+        shared_task = SharedTask(arena=arena, loader=loader, data={
+            'Arena': 'my_arena', 'ArenaTaskID': 'a1', 'description': 'x',
+            'tags': ['b', 'a'], 'depends': 'u2,u1',
+            'entry': '20150101T000000Z'})
+        self.assertEqual(shared_task.ArenaTaskID, 'a1')
+        self.assertEqual(shared_task.get('tags'), 'a,b')
+        self.assertEqual(shared_task.get('depends'), 'u1,u2')
+        self.assertEqual(shared_task.last_modified(), '20150101T000000Z')
+        self.assertFalse(loader.called)
+        shared_task.tw_task['description'] = 'y'
+        self.assertEqual(shared_task.get('description'), 'y')
+        self.assertEqual(loader.call_count, 1)
+
 
 class TestEnhancedTaskWarrior(unittest.TestCase):
     def setUp(self):
         self.patcher1 = patch('tasklib.task.TaskWarrior')
         self.MockClass1 = self.patcher1.start()
+        patch_taskrc(self)
 
     def tearDown(self):
         self.patcher1.stop()
@@ -114,11 +138,108 @@ class TestEnhancedTaskWarrior(unittest.TestCase):
         etw = EnhancedTaskWarrior(tw, 'B')
         self.assertEqual(type(etw), EnhancedTaskWarrior)
 
+    def test_save_tasks(self):
+        tw = tlib.TaskWarrior()
+        etw = EnhancedTaskWarrior(tw, TaskArena('my_arena'))
+        existing = SharedTask(tlib.Task(tw))
+        existing.tw_task._load_data({'uuid': 'a', 'description': 'old'})
+        existing.tw_task['description'] = 'new'
+        created = SharedTask(tlib.Task(tw))
+        created.tw_task['description'] = 'created'
+
+        def execute_command(args):
+            if args[0] == 'import':
+                with open(args[1]) as f:
+                    self.imported = [json.loads(l) for l in f]
+                return ['']
+            return [json.dumps({'uuid': u, 'description': 'x'}) + ','
+                    for u in args[:-1]]
+
+        tw.execute_command.side_effect = execute_command
+        results = etw.save_tasks([existing, created])
+        self.assertEqual([r[1] for r in results], [None, None])
+        self.assertEqual(len(self.imported), 2)
+        self.assertEqual(self.imported[0]['description'], 'new')
+        self.assertNotIn('id', self.imported[1])
+        self.assertTrue(created.tw_task['uuid'])
+        self.assertEqual(created.tw_task['description'], 'x')
+
+    @patch.object(SharedTask, 'save', side_effect=[None, tlib.TaskWarriorException('bad')])
+    def test_save_tasks_falls_back_to_single_saves(self, mock_save):
+        tw = tlib.TaskWarrior()
+        etw = EnhancedTaskWarrior(tw, TaskArena('my_arena'))
+        tasks = [SharedTask(tlib.Task(tw)), SharedTask(tlib.Task(tw))]
+
+        def execute_command(args):
+            if args[0] == 'import':
+                raise tlib.TaskWarriorException('import failed')
+            return ['']
+
+        tw.execute_command.side_effect = execute_command
+        results = etw.save_tasks(tasks)
+        self.assertEqual(mock_save.call_count, 2)
+        self.assertIsNone(results[0][1])
+        self.assertEqual(str(results[1][1]), 'bad')
+        self.assertIsNone(tasks[0].tw_task['uuid'])
+
+    def test_copies_write_exported_values(self):
+        etw = EnhancedTaskWarrior(tlib.TaskWarrior(), TaskArena('my_arena'))
+        source = etw._shared_task({
+            'uuid': 'u1', 'Arena': 'my_arena', 'ArenaTaskID': 'a1',
+            'description': 'new', 'due': '20150102T000000Z', 'tags': ['a']})
+        target = etw._shared_task({
+            'uuid': 'u2', 'Arena': 'my_arena', 'ArenaTaskID': 'a1',
+            'description': 'old', 'project': 'p', 'tags': ['a']})
+        self.assertIsNone(target._snapshot)
+        target.update(source)
+        created = etw.add_task(source)
+        self.assertIsNone(target._tw_task)
+        self.assertIsNone(created._tw_task)
+        data = target.export_data()
+        self.assertEqual(data['due'], '20150102T000000Z')
+        self.assertEqual(data['description'], 'new')
+        self.assertNotIn('project', data)
+        self.assertEqual(created.get('description'), 'new')
+        self.assertEqual(created.ArenaTaskID, created.get('ArenaTaskID'))
+        self.assertTrue(created.ArenaTaskID)
+        # a task saved on its own sees the copied fields as modified
+        self.assertEqual(set(target.tw_task._modified_fields),
+                         {'description', 'due', 'project'})
+
+    def test_tasks_by_arena_task_ids_uses_index(self):
+        index = TaskIndex('local')
+        index.set('my_arena', 'a1', 'u1', '')
+        index.set('my_arena', 'a2', 'u2', '')
+        index.set('other_arena', 'a3', 'u4', '')
+        etw = EnhancedTaskWarrior(tlib.TaskWarrior(), TaskArena('my_arena'),
+                                  index=index)
+
+        def shared_task(arena_task_id, task_uuid):
+            task = SharedTask({'uuid': task_uuid, 'modified': '',
+                               'entry': ''})
+            task.ArenaTaskID = arena_task_id
+            return task
+
+        by_uuid = [shared_task('a1', 'u1'), shared_task('other', 'u2')]
+        by_filter = [shared_task('a2', 'u5'), shared_task('a3', 'u3')]
+        with patch.object(EnhancedTaskWarrior, 'tasks',
+                          side_effect=[by_uuid, by_filter]) as mock_tasks:
+            tasks = etw.tasks_by_arena_task_ids(['a1', 'a2', 'a3'])
+        self.assertEqual(mock_tasks.call_args_list[0][0][0],
+                         ['(uuid:u1 or uuid:u2)'])
+        self.assertEqual(mock_tasks.call_args_list[1][0][0],
+                         ['Arena:my_arena', '(ArenaTaskID:a2 or ArenaTaskID:a3)'])
+        self.assertEqual(tasks, [by_uuid[0]] + by_filter)
+        self.assertEqual(index.get('my_arena', 'a2'), ('u5', ''))
+        self.assertEqual(index.get('my_arena', 'a3'), ('u3', ''))
+        self.assertEqual(index.get('other_arena', 'a3'), ('u4', ''))
+
 
 class TestTaskArena(unittest.TestCase):
     def setUp(self):
         self.patcher1 = patch('tasklib.task.TaskWarrior')
         self.MockClass1 = self.patcher1.start()
+        patch_taskrc(self)
 
     def tearDown(self):
         self.patcher1.stop()
@@ -149,11 +270,117 @@ class TestTaskArena(unittest.TestCase):
         self.assertEqual(arena.remote_data, 'remote')
         self.assertEqual(arena.name, 'my_arena')
 
+    def test_task_warriors_are_created_lazily(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        self.assertFalse(self.MockClass1.called)
+        self.assertEqual(type(arena.tw_local), EnhancedTaskWarrior)
+        self.assertFalse(self.MockClass1.called)
+        self.assertIs(arena.tw_local.tw, arena.tw_local.tw)
+        self.MockClass1.assert_called_once_with(data_location='local',
+                                                taskrc_location='taskrc')
+        self.assertIs(arena.tw_local, arena.tw_local)
+        self.assertEqual(self.MockClass1.call_count, 1)
+
+    def test_task_warriors_are_pooled(self):
+        self.MockClass1.side_effect = \
+            lambda data_location, taskrc_location: MagicMock()
+        pool = TaskWarriorPool()
+        arena1 = TaskArena('arena1', 'local', 'remote1', pool)
+        arena2 = TaskArena('arena2', 'local', 'remote2', pool)
+        self.assertIs(arena1.tw_local.tw, arena2.tw_local.tw)
+        self.assertIsNot(arena1.tw_remote.tw, arena2.tw_remote.tw)
+        self.assertIs(arena1.tw_local.arena, arena1)
+        self.assertIs(arena2.tw_local.arena, arena2)
+
+    def test_task_calls_are_limited_per_store(self):
+        running = []
+        most_running = []
+
+        def execute_command(args):
+            running.append(args)
+            most_running.append(len(running))
+            time.sleep(0.01)
+            running.remove(args)
+
+        self.MockClass1.return_value.execute_command.side_effect = \
+            execute_command
+        tw = TaskWarriorPool(max_task_calls=1).get('local')
+        threads = [threading.Thread(target=tw.execute_command, args=([i],))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(most_running, [1, 1, 1])
+
+    def test_sync_watermark(self):
+        def task(modified):
+            return SharedTask(data={'modified': modified})
+
+        arena = TaskArena('my_arena', 'local', 'remote')
+        started = '20150101T120000Z'
+        self.assertEqual(arena.sync_watermark(started, []),
+                         '20150101T115000Z')
+        # remote clocks behind ours move the watermark back
+        self.assertEqual(arena.sync_watermark(
+            started, [task('20150101T100000Z'), task('20150101T110000Z')]),
+            '20150101T105000Z')
+        self.assertEqual(arena.sync_watermark(
+            started, [task('20150102T000000Z')]), '20150101T115000Z')
+        # but never before the last sync
+        arena.last_sync = '20150101T108000Z'
+        self.assertEqual(arena.sync_watermark(
+            started, [task('20141001T000000Z')]), '20150101T108000Z')
+
+    def test_json_last_sync(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        arena.last_sync = '20150101T000000Z'
+        self.assertEqual(arena.json['last_sync'], '20150101T000000Z')
+        other = TaskArena()
+        other.json = arena.json
+        self.assertEqual(other.last_sync, '20150101T000000Z')
+
+    def test_json_reader(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        self.assertNotIn('reader', arena.json)
+        arena.reader = 'native'
+        other = TaskArena()
+        other.json = arena.json
+        self.assertEqual(other.reader, 'native')
+        self.assertIsNotNone(other.tw_local.reader)
+
+    def test_add_partners(self):
+        def shared_task(arena_task_id):
+            task = SharedTask({'uuid': None})
+            task.ArenaTaskID = arena_task_id
+            return task
+
+        arena = TaskArena('my_arena', 'local', 'remote')
+        ltask = shared_task('a')
+        rtask = shared_task('b')
+        partners = {'local': [shared_task('b')], 'remote': [shared_task('a')]}
+        with patch.object(EnhancedTaskWarrior, 'tasks',
+                          side_effect=[[ltask], [rtask]]) as mock_tasks, \
+                patch.object(arena.tw_local, 'tasks_by_arena_task_ids',
+                             return_value=partners['local']) as mock_local, \
+                patch.object(arena.tw_remote, 'tasks_by_arena_task_ids',
+                             return_value=partners['remote']) as mock_remote:
+            local_tasks, remote_tasks = arena.add_partners(
+                arena.get_local_tasks(since='now'),
+                arena.get_remote_tasks(since='now'))
+        self.assertEqual(mock_tasks.call_args_list[0][0][0],
+                         ['Arena:my_arena', 'modified.after:now'])
+        mock_local.assert_called_once_with({'b'})
+        mock_remote.assert_called_once_with({'a'})
+        self.assertEqual(local_tasks, [ltask] + partners['local'])
+        self.assertEqual(remote_tasks, [rtask] + partners['remote'])
+
 
 class TestTaskEmperor(unittest.TestCase):
     def setUp(self):
         self.patcher1 = patch('tasklib.task.TaskWarrior')
         self.MockClass1 = self.patcher1.start()
+        patch_taskrc(self)
 
     def tearDown(self):
         self.patcher1.stop()
@@ -173,12 +400,34 @@ class TestTaskEmperor(unittest.TestCase):
         task_emperor.delete_arena(arena)
         self.assertEqual(task_emperor.arenas, [])
 
+    def test_arenas_share_pool(self):
+        task_emperor = TaskEmperor()
+        task_emperor.json = {'arenas': [
+            {'name': 'a', 'local_data': 'local', 'remote_data': 'remote_a'},
+            {'name': 'b', 'local_data': 'local', 'remote_data': 'remote_b'}]}
+        self.assertFalse(self.MockClass1.called)
+        self.assertIs(task_emperor.find('a').tw_local.tw,
+                      task_emperor.find('b').tw_local.tw)
+
     def test_find_arena(self):
         task_emperor = TaskEmperor()
         arena = task_emperor.create_arena('my_arena', '\A', '\B')
         found = task_emperor.find('my_arena')
         self.assertEqual(arena, found)
 
+    def test_arenas_are_built_on_demand(self):
+        task_emperor = TaskEmperor()
+        data = {'arenas': [
+            {'name': 'a', 'local_data': 'local', 'remote_data': 'remote_a'},
+            {'name': 'b', 'local_data': 'local', 'remote_data': 'remote_b'}]}
+        task_emperor.json = data
+        with patch('tarenalib.arena.TaskArena', wraps=TaskArena) as mock_arena:
+            self.assertEqual(task_emperor.find('b').remote_data, 'remote_b')
+            self.assertIsNone(task_emperor.find('c'))
+        self.assertEqual(mock_arena.call_count, 1)
+        self.assertEqual(task_emperor.names, ['a', 'b'])
+        self.assertEqual(task_emperor.changes(), {})
+
     def test_save_load(self):
         task_emperor = TaskEmperor()
         f = StringIO()
@@ -20,9 +20,13 @@
 
 
 from click.testing import CliRunner
+import subprocess
+import sys
 import unittest
+from unittest.mock import patch
 from tarenalib.arena import uda_config_list
 from tarenalib.cli import cli
+from tarenalib.server import DaemonError
 from tasklib.task import TaskWarrior, Task
 import os
 
@@ -37,14 +41,28 @@ cmd_dummy_arena = ['--file', 'taconfig', 'create',
 class TestTArena(unittest.TestCase):
     def setUp(self):
         self.runner = CliRunner()
+        # the generated taskrc goes to the isolated filesystem of each test
+        self.patcher1 = patch('tarenalib.taskrc.uda_file', 'arena.rc')
+        self.patcher1.start()
+        self.patcher2 = patch('tarenalib.taskrc.arena_taskrc', 'arena.taskrc')
+        self.patcher2.start()
+
+    def tearDown(self):
+        self.patcher1.stop()
+        self.patcher2.stop()
 
     def test_install(self):
-        with self.runner.isolated_filesystem():
+        with self.runner.isolated_filesystem(), \
+                patch.dict(os.environ, {'TASKRC': 'taskrc'}), \
+                patch('tarenalib.taskrc.uda_file', 'arena.rc'):
             result = self.runner.invoke(cli, ['install'])
+            assert os.path.isfile('arena.rc')
         assert 'successful' in result.output
 
     def test_uninstall(self):
-        with self.runner.isolated_filesystem():
+        with self.runner.isolated_filesystem(), \
+                patch.dict(os.environ, {'TASKRC': 'taskrc'}), \
+                patch('tarenalib.taskrc.uda_file', 'arena.rc'):
             result = self.runner.invoke(cli, ['uninstall'])
         assert 'successful' in result.output
 
@@ -151,3 +169,32 @@ class TestTArena(unittest.TestCase):
             self.runner.invoke(cli, cmd + ['add', 'foo', description])
             result = self.runner.invoke(cli, cmd + ['sync', 'foo'], input='a\n')
             assert len(tw_remote.tasks.filter()) == 1
+
+    def test_sync_without_arenas(self):
+        with self.runner.isolated_filesystem():
+            self.runner.invoke(cli, cmd_dummy_arena)
+            with open('taconfig') as f:
+                config = f.read()
+            result = self.runner.invoke(cli, cmd + ['sync'])
+            self.assertEqual(result.exit_code, 2)
+            self.assertIn('--all', result.output)
+            with open('taconfig') as f:
+                self.assertEqual(f.read(), config)
+
+    def test_daemon_errors_are_not_run_again(self):
+        with self.runner.isolated_filesystem():
+            self.runner.invoke(cli, cmd_dummy_arena)
+            with patch('tarenalib.server.request', side_effect=DaemonError(
+                    'The tarena daemon stopped responding.')), \
+                    patch('tarenalib.commands.add_tasks') as mock_add:
+                result = self.runner.invoke(cli, cmd + ['add', 'foo'])
+        self.assertEqual(result.exit_code, 1)
+        self.assertIn('stopped responding', result.output)
+        self.assertFalse(mock_add.called)
+
+    def test_import_is_lazy(self):
+        code = ('import sys, tarenalib.cli; '
+                'print(sorted(m for m in ("tasklib", "tarenalib.arena", '
+                '"tarenalib.sync") if m in sys.modules))')
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.decode().strip(), '[]')
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import datetime
+import unittest
+from unittest.mock import patch
+import tasklib.task as tlib
+
+from tarenalib.arena import SharedTask, TaskArena, field_bits
+from tarenalib import diff
+from tarenalib.diff import ArenaColumns, diff_columns, diff_in_processes, \
+    diff_pairs, diff_snapshots, snapshot
+from tarenalib.io import IOManager
+from tarenalib.sync import SyncManager
+from tarenalib.tests import patch_taskrc
+
+
+class TestDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.patcher1 = patch('tasklib.task.TaskWarrior')
+        self.MockClass1 = self.patcher1.start()
+        self.arena = TaskArena('my_arena', 'local', 'remote')
+        patch_taskrc(self)
+
+    def tearDown(self):
+        self.patcher1.stop()
+
+    def create_pair(self, arena_task_id, ldescription, rdescription):
+        pair = []
+        for description in ldescription, rdescription:
+            task = SharedTask(tlib.Task(tlib.TaskWarrior()), self.arena)
+            task.ArenaTaskID = arena_task_id
+            task.tw_task['description'] = description
+            pair.append(task)
+        return pair
+
+    def test_diff_snapshots(self):
+        ltask, rtask = self.create_pair('a1', 'paint walls', 'paint walls')
+        self.assertEqual(diff_snapshots([('a1', snapshot(ltask),
+                                          snapshot(rtask))]), [])
+        rtask.tw_task['description'] = 'paint ceilling'
+        rtask.tw_task['due'] = datetime.datetime(2015, 1, 1,
+                                                 tzinfo=datetime.timezone.utc)
+        self.assertEqual(
+            diff_snapshots([('a1', snapshot(ltask), snapshot(rtask))]),
+            [('a1', field_bits['description'] | field_bits['due'])])
+
+    def test_snapshots_are_normalized_by_the_workers(self):
+        local = SharedTask(data={'description': 'x', 'tags': ['b', 'a'],
+                                 'depends': 'u2,u1'})
+        remote = SharedTask(data={'description': 'y', 'tags': ['a', 'b'],
+                                  'depends': ['u1', 'u2']})
+        self.assertIn(['b', 'a'], snapshot(local))
+        self.assertEqual(
+            diff_snapshots([('a1', snapshot(local), snapshot(remote))]),
+            [('a1', field_bits['description'])])
+
+    def test_diff_in_processes(self):
+        pairs = [self.create_pair(str(i), 'task', 'task' if i % 3 else 'new')
+                 for i in range(30)]
+        masks = diff_in_processes(pairs, 2)
+        self.assertEqual(masks, dict((str(i), field_bits['description'])
+                                     for i in range(0, 30, 3)))
+
+    @patch('tarenalib.sync.min_pairs_per_process', 1)
+    def test_parallel_synclist_matches_serial(self):
+        pairs = [self.create_pair(str(i), 'task', 'task' if i % 3 else 'new')
+                 for i in range(30)]
+        local_tasks = [ltask for ltask, rtask in pairs]
+        remote_tasks = [rtask for ltask, rtask in pairs]
+        serial = SyncManager(self.arena, IOManager(False))
+        serial.generate_synclist(local_tasks, remote_tasks)
+        parallel = SyncManager(self.arena, IOManager(False), diff_workers=2)
+        with patch('tarenalib.sync.diff_in_processes',
+                   wraps=diff_in_processes) as mock_diff:
+            parallel.generate_synclist(local_tasks, remote_tasks)
+        self.assertTrue(mock_diff.called)
+        self.assertEqual(
+            [(e.local_task.ArenaTaskID, e.fields_mask)
+             for e in parallel.synclist],
+            [(e.local_task.ArenaTaskID, e.fields_mask)
+             for e in serial.synclist])
+        self.assertEqual(len(parallel.synclist), 10)
+
+    def check_diff_columns(self):
+        pairs = [self.create_pair('a1', 'task', 'task'),
+                 self.create_pair('a2', 'task', 'new')]
+        pairs[1][0].tw_task._data['modified'] = datetime.datetime(
+            2015, 1, 2, tzinfo=datetime.timezone.utc)
+        pairs[1][1].tw_task._data['modified'] = datetime.datetime(
+            2015, 1, 1, tzinfo=datetime.timezone.utc)
+        pairs[1][1].tw_task['priority'] = 'H'
+        local = ArenaColumns([ltask for ltask, rtask in pairs])
+        remote = ArenaColumns([rtask for ltask, rtask in pairs])
+        masks, local_newer = diff_columns(local, remote)
+        self.assertEqual(masks, [0, field_bits['description'] |
+                                 field_bits['priority']])
+        self.assertEqual(local_newer, [True, True])
+        self.assertEqual(diff_columns(ArenaColumns([]), ArenaColumns([])),
+                         ([], []))
+
+    def test_diff_columns(self):
+        with patch('tarenalib.diff.numpy', None):
+            self.check_diff_columns()
+
+    @unittest.skipIf(diff.numpy is None, 'numpy is not installed')
+    def test_diff_columns_numpy(self):
+        self.check_diff_columns()
+
+    def check_diff_pairs(self):
+        pairs = [self.create_pair('a1', 'task', 'task'),
+                 self.create_pair('a2', 'task', 'new')]
+        masks, local_newer = diff_pairs(pairs)
+        self.assertEqual(masks, {'a2': field_bits['description']})
+        return local_newer
+
+    def test_diff_pairs(self):
+        with patch('tarenalib.diff.numpy', None):
+            self.assertEqual(self.check_diff_pairs(), {})
+
+    @unittest.skipIf(diff.numpy is None, 'numpy is not installed')
+    def test_diff_pairs_numpy(self):
+        self.assertEqual(list(self.check_diff_pairs()), ['a2'])
+
+    def test_stream_is_diffed_per_chunk(self):
+        pairs = [self.create_pair(str(i), 'task', 'task' if i % 3 else 'new')
+                 for i in range(30)]
+        sm = SyncManager(self.arena, IOManager(False))
+        with patch.object(SyncManager, 'diff_matched_tasks',
+                          wraps=sm.diff_matched_tasks) as mock_diff:
+            elements = list(sm.iter_synclist(
+                (ltask for ltask, rtask in pairs),
+                [rtask for ltask, rtask in pairs], 10))
+        self.assertEqual([len(call[0][0]) for call in
+                          mock_diff.call_args_list], [10, 10, 10])
+        self.assertEqual(len(elements), 10)
+
+    def test_synclist_suggests_newest(self):
+        ltask, rtask = self.create_pair('a1', 'task', 'new')
+        rtask.tw_task._data['modified'] = datetime.datetime(
+            2015, 1, 1, tzinfo=datetime.timezone.utc)
+        sm = SyncManager(self.arena, IOManager(False))
+        sm.generate_synclist([ltask], [rtask])
+        self.assertFalse(sm.synclist[0].local_newer)
+        sm.suggest_conflict_resolution()
+        self.assertEqual(sm.synclist[0].suggestion, 'DOWNLOAD')
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import tempfile
+import unittest
+
+from tarenalib.index import TaskIndex, index_filename
+
+
+class TestTaskIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_set_get_discard(self):
+        index = TaskIndex(self.tmpdir.name)
+        self.assertIsNone(index.get('house', 'a1'))
+        index.set('house', 'a1', 'u1', '20150101T000000Z')
+        self.assertIn(('house', 'a1'), index)
+        self.assertEqual(index.get('house', 'a1'), ('u1', '20150101T000000Z'))
+        index.discard('house', 'a1')
+        self.assertNotIn(('house', 'a1'), index)
+        index.discard('house', 'a1')
+
+    def test_entries_are_kept_per_arena(self):
+        index = TaskIndex(self.tmpdir.name)
+        index.set('house', 'a1', 'u1', '')
+        index.set('garden', 'a1', 'u2', '')
+        self.assertEqual(index.get('house', 'a1'), ('u1', ''))
+        self.assertEqual(index.get('garden', 'a1'), ('u2', ''))
+        index.discard('garden', 'a1')
+        self.assertEqual(index.get('house', 'a1'), ('u1', ''))
+
+    def test_save_load(self):
+        index = TaskIndex(self.tmpdir.name)
+        index.set('house', 'a1', 'u1', '20150101T000000Z')
+        index.save()
+        self.assertFalse(index.dirty)
+        self.assertEqual(os.listdir(self.tmpdir.name), [index_filename])
+        other = TaskIndex(self.tmpdir.name)
+        self.assertEqual(other.get('house', 'a1'), ('u1', '20150101T000000Z'))
+        self.assertEqual(len(other), 1)
+
+    def test_entries_of_older_versions_are_skipped(self):
+        with open(os.path.join(self.tmpdir.name, index_filename), 'w') as f:
+            f.write('{"a1": ["u1", ""]}')
+        self.assertEqual(len(TaskIndex(self.tmpdir.name)), 0)
+
+    def test_unchanged_entries_are_not_saved(self):
+        index = TaskIndex(self.tmpdir.name)
+        index.set('house', 'a1', 'u1', '20150101T000000Z')
+        index.save()
+        index.set('house', 'a1', 'u1', '20150101T000000Z')
+        self.assertFalse(index.dirty)
+
+    def test_save_to_missing_directory(self):
+        index = TaskIndex(os.path.join(self.tmpdir.name, 'missing'))
+        index.set('house', 'a1', 'u1', '')
+        index.save()
+        self.assertTrue(index.dirty)
@@ -25,6 +25,7 @@ from unittest.mock import patch
 from click.testing import CliRunner
 import os
 from tarenalib.io import IOManager
+from tarenalib.arena import EnhancedTaskWarrior
 
 
 class TestIOManager(unittest.TestCase):
@@ -93,4 +94,28 @@ class TestIOManager(unittest.TestCase):
             self.assertEqual(arena.local_data, te.arenas[0].local_data)
             self.assertEqual(arena.remote_data, te.arenas[0].remote_data)
 
+    @patch('tasklib.task.TaskWarrior')
+    def test_save_task_emperor_merges_changes(self, mock_tw):
+        runner = CliRunner()
+        sys.stdout = self.old_stdout
+        with runner.isolated_filesystem():
+            iom = IOManager(False, 75, os.getcwd() + '/config_file')
+            te = iom.get_task_emperor()
+            te.create_arena('foo', 'local', 'remote')
+            te.create_arena('bar', 'local', 'remote')
+            iom.save_task_emperor(te)
+            first = iom.get_task_emperor()
+            second = iom.get_task_emperor()
+            first.create_arena('baz', 'local', 'remote')
+            first.find('foo').last_sync = '20150101T000000Z'
+            with patch.object(EnhancedTaskWarrior,
+                              'remove_tasks_matching_pattern'):
+                second.delete_arena(second.find('bar'))
+            iom.save_task_emperor(first)
+            iom.save_task_emperor(second)
+            te = iom.get_task_emperor()
+            self.assertEqual(te.names, ['foo', 'baz'])
+            self.assertEqual(te.find('foo').last_sync, '20150101T000000Z')
+            self.assertFalse(os.path.isfile(iom.configfile_name + '.tmp'))
+
 
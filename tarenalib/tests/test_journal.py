@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import tempfile
+import unittest
+
+from tarenalib.journal import Journal
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.journal = Journal(os.path.join(self.tmpdir.name, 'journal'))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_read_missing(self):
+        self.assertEqual(self.journal.read(None), (None, None))
+
+    def test_append_read(self):
+        self.journal.append([{'id': 'a1'}])
+        entries, position = self.journal.read(None)
+        self.assertIsNone(entries)
+        self.journal.append([{'id': 'a2'}, {'id': 'a3'}])
+        entries, new_position = self.journal.read(position)
+        self.assertEqual(entries, [{'id': 'a2'}, {'id': 'a3'}])
+        self.assertEqual(self.journal.read(new_position), ([], new_position))
+
+    def test_partial_lines_are_not_read(self):
+        self.journal.append([{'id': 'a1'}])
+        entries, position = self.journal.read(None)
+        with open(self.journal.filename, 'a') as f:
+            f.write('{"id": "a2"')
+        self.assertEqual(self.journal.read(position), ([], position))
+
+    def test_compact_invalidates_positions(self):
+        self.journal.append([{'id': 'a1'}])
+        entries, position = self.journal.read(None)
+        self.journal.compact()
+        entries, new_position = self.journal.read(position)
+        self.assertIsNone(entries)
+        self.assertNotEqual(new_position[0], position[0])
+
+    def test_append_compacts_large_journal(self):
+        self.journal.max_size = 100
+        self.journal.append([{'id': 'a1'}])
+        entries, position = self.journal.read(None)
+        self.journal.append([{'id': 'a' * 100}])
+        entries, new_position = self.journal.read(position)
+        self.assertIsNone(entries)
+        self.assertEqual(self.journal.read([new_position[0], 0])[0],
+                         [{'id': 'a' * 100}])
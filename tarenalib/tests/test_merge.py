@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import os
+import tempfile
+import unittest
+
+from tarenalib.arena import SharedTask, tw_attrs_editable
+from tarenalib.merge import BaseStore, merge
+
+
+def create_shared_task(arena_task_id, **fields):
+    shared_task = SharedTask({attr: '' for attr in tw_attrs_editable})
+    shared_task.ArenaTaskID = arena_task_id
+    shared_task.tw_task.update(fields)
+    return shared_task
+
+
+class TestMerge(unittest.TestCase):
+
+    def setUp(self):
+        self.base = create_shared_task(
+            '1', description='paint walls', priority='L').field_values()
+
+    def test_merge_non_overlapping_changes(self):
+        local_task = create_shared_task('1', description='paint ceilling',
+                                        priority='L')
+        remote_task = create_shared_task('1', description='paint walls',
+                                         priority='H')
+        result = merge(self.base, local_task, remote_task)
+        self.assertEqual(result.upload_fields, ['description'])
+        self.assertEqual(result.download_fields, ['priority'])
+        self.assertEqual(result.conflicts, [])
+
+    def test_merge_overlapping_changes(self):
+        local_task = create_shared_task('1', description='paint ceilling',
+                                        priority='L')
+        remote_task = create_shared_task('1', description='paint floor',
+                                         priority='L')
+        result = merge(self.base, local_task, remote_task)
+        self.assertEqual(result.conflicts, ['description'])
+
+    def test_merge_same_change_on_both_sides(self):
+        local_task = create_shared_task('1', description='paint walls',
+                                        priority='H')
+        remote_task = create_shared_task('1', description='paint walls',
+                                         priority='H')
+        result = merge(self.base, local_task, remote_task)
+        self.assertEqual(result.upload_fields, [])
+        self.assertEqual(result.download_fields, [])
+        self.assertEqual(result.conflicts, [])
+
+
+class TestBaseStore(unittest.TestCase):
+
+    def test_set_get_save(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'base.json')
+            store = BaseStore(filename)
+            self.assertIsNone(store.get('1'))
+            store.set(create_shared_task('1', description='paint walls'))
+            self.assertIn('1', store)
+            store.save()
+            store = BaseStore(filename)
+            base = store.get('1')
+            self.assertEqual(base['description'], 'paint walls')
+            self.assertEqual(base['priority'], '')
+
+    def test_save_keeps_concurrent_saves(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filename = os.path.join(tmp_dir, 'base.json')
+            store1 = BaseStore(filename)
+            store2 = BaseStore(filename)
+            self.assertIsNone(store1.get('1'))
+            self.assertIsNone(store2.get('2'))
+            store1.set(create_shared_task('1', description='paint walls'))
+            store2.set(create_shared_task('2', description='clean floor'))
+            store1.save()
+            store2.save()
+            self.assertEqual(store2.get('1')['description'], 'paint walls')
+            store = BaseStore(filename)
+            self.assertEqual(store.get('1')['description'], 'paint walls')
+            self.assertEqual(store.get('2')['description'], 'clean floor')
+            self.assertEqual(sorted(os.listdir(tmp_dir)),
+                             ['base.json', 'base.json.lock'])
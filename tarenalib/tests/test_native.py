@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+import tasklib.task as tlib
+
+from tarenalib.arena import EnhancedTaskWarrior, TaskArena
+from tarenalib.native import NativeReader, NativeReaderError, parse_line, \
+    compile_filter
+from tarenalib.tests import patch_taskrc
+
+pending_data = (
+    '[description:"paint &open;walls&close; \\"now\\"" entry:"1420070400" '
+    'status:"pending" tags:"home,paint" uuid:"u1" Arena:"house" '
+    'ArenaTaskID:"a1" modified:"1420074000" '
+    'annotation_1420070460:"bring brushes"]\n'
+    '[description:"do dishes" entry:"1420070400" status:"deleted" '
+    'uuid:"u2" Arena:"house" ArenaTaskID:"a2" modified:"1420160400"]\n'
+    '[description:"read" entry:"1420070400" status:"pending" uuid:"u3"]\n'
+)
+completed_data = (
+    '[description:"cut lawn" entry:"1420070400" end:"1420074000" '
+    'status:"completed" uuid:"u4" Arena:"house" ArenaTaskID:"a4" '
+    'modified:"1420074000"]\n'
+)
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_parse_line(self):
+        data = parse_line(pending_data.split('\n')[0])
+        self.assertEqual(data['description'], 'paint [walls] "now"')
+        self.assertEqual(data['entry'], '20150101T000000Z')
+        self.assertEqual(data['modified'], '20150101T010000Z')
+        self.assertEqual(data['tags'], ['home', 'paint'])
+        self.assertEqual(data['annotations'],
+                         [{'entry': '20150101T000100Z',
+                           'description': 'bring brushes'}])
+        self.assertEqual(data['ArenaTaskID'], 'a1')
+
+    def test_parse_unknown_line(self):
+        self.assertRaises(NativeReaderError, parse_line, '{"uuid": "u1"}')
+
+    def test_compile_filter(self):
+        data = parse_line(pending_data.split('\n')[0])
+        self.assertTrue(compile_filter('Arena:house')(data))
+        self.assertFalse(compile_filter('Arena:hou')(data))
+        self.assertTrue(compile_filter('modified.after:20150101T000000Z')(data))
+        self.assertFalse(compile_filter('modified.after:20150101T010000Z')(data))
+        self.assertTrue(compile_filter('(ArenaTaskID:a0 or ArenaTaskID:a1)')(data))
+        self.assertRaises(NativeReaderError, compile_filter, 'project:house')
+        self.assertRaises(NativeReaderError, compile_filter, 'dishes')
+
+
+class TestNativeReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.data_location = self.tmp_dir.name
+        for filename, content in (('pending.data', pending_data),
+                                  ('completed.data', completed_data)):
+            with open(os.path.join(self.data_location, filename), 'w') as f:
+                f.write(content)
+        patch_taskrc(self)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_export(self):
+        reader = NativeReader(self.data_location)
+        tasks = reader.export(['Arena:house'])
+        self.assertEqual([t['uuid'] for t in tasks], ['u1', 'u2', 'u4'])
+        self.assertEqual(tasks[0]['id'], 1)
+        self.assertNotIn('id', tasks[1])
+        self.assertEqual(reader.export(['uuid:u3'])[0]['id'], 2)
+        tasks = reader.export(['Arena:house',
+                               'modified.after:20150101T020000Z'])
+        self.assertEqual([t['uuid'] for t in tasks], ['u2'])
+
+    def test_export_without_data_files(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reader = NativeReader(tmp_dir)
+            self.assertRaises(NativeReaderError, reader.export, [])
+
+    @patch('tasklib.task.TaskWarrior')
+    def test_enhanced_task_warrior_reads_natively(self, mock_warrior):
+        tw = tlib.TaskWarrior()
+        arena = TaskArena('house')
+        etw = EnhancedTaskWarrior(tw, arena, NativeReader(self.data_location))
+        tasks = etw.tasks(['Arena:house'])
+        self.assertFalse(tw.execute_command.called)
+        self.assertEqual(len(tasks), 3)
+        self.assertEqual(tasks[0].ArenaTaskID, 'a1')
+        self.assertEqual(tasks[2].tw_task['status'], 'completed')
+
+    @patch('tasklib.task.TaskWarrior')
+    def test_native_arena_reads_without_task_warrior(self, mock_warrior):
+        arena = TaskArena('house', self.data_location, self.data_location)
+        arena.reader = 'native'
+        tasks = arena.get_local_tasks()
+        self.assertEqual(len(tasks), 3)
+        self.assertFalse(mock_warrior.called)
+
+    @patch('tasklib.task.TaskWarrior')
+    def test_enhanced_task_warrior_falls_back(self, mock_warrior):
+        tw = tlib.TaskWarrior()
+        tw.execute_command.return_value = []
+        etw = EnhancedTaskWarrior(tw, TaskArena('house'),
+                                  NativeReader(self.data_location))
+        self.assertEqual(etw.tasks(['Arena:house', 'dishes']), [])
+        tw.execute_command.assert_called_once_with(
+            ['export', '--', 'Arena:house', 'dishes'])
+
+    @patch('tasklib.task.TaskWarrior')
+    def test_command_words_stay_filters(self, mock_warrior):
+        tw = tlib.TaskWarrior()
+        tw.execute_command.return_value = []
+        etw = EnhancedTaskWarrior(tw, TaskArena('house'),
+                                  NativeReader(self.data_location))
+        for word in ['undo', 'add', 'log']:
+            tw.execute_command.reset_mock()
+            etw.tasks(['Arena:house', word])
+            tw.execute_command.assert_called_once_with(
+                ['export', '--', 'Arena:house', word])
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+
+import unittest
+from io import StringIO
+import json
+from unittest.mock import MagicMock, patch
+
+from tarenalib import profiling
+from tarenalib.arena import TaskArena
+from tarenalib.io import IOManager
+from tarenalib.sync import SyncManager
+from tarenalib.tests import patch_taskrc
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_spans(self):
+        profiler = profiling.Profiler()
+        with profiler.span('outer', arena='foo'):
+            with profiler.span('inner'):
+                pass
+        spans = profiler.get_json()['spans']
+        self.assertEqual([s['name'] for s in spans], ['outer', 'inner'])
+        self.assertEqual([s['depth'] for s in spans], [0, 1])
+        self.assertEqual(spans[0]['args'], {'arena': 'foo'})
+        self.assertGreaterEqual(spans[0]['duration'], spans[1]['duration'])
+
+    def test_trace_task_warrior(self):
+        profiler = profiling.Profiler()
+        tw = MagicMock()
+        tw.execute_command.return_value = ['output']
+        profiler.trace_task_warrior(tw)
+        self.assertEqual(tw.execute_command(['export']), ['output'])
+        self.assertEqual(profiler.spans[0]['name'], 'task')
+        self.assertEqual(profiler.spans[0]['args'], {'argv': ['export']})
+
+    def test_dump_trace(self):
+        profiler = profiling.Profiler()
+        with profiler.span('sync'):
+            pass
+        f = StringIO()
+        profiler.dump(f, 'trace')
+        event = json.loads(f.getvalue())['traceEvents'][0]
+        self.assertEqual(event['name'], 'sync')
+        self.assertEqual(event['ph'], 'X')
+
+    def test_null_profiler(self):
+        profiler = profiling.get_profiler()
+        self.assertIsInstance(profiler, profiling.NullProfiler)
+        tw = MagicMock()
+        self.assertIs(profiler.trace_task_warrior(tw), tw)
+        with profiler.span('nothing'):
+            pass
+
+    @patch('tasklib.task.TaskWarrior')
+    def test_sync_phases(self, mock_warrior):
+        patch_taskrc(self)
+        profiler = profiling.enable()
+        try:
+            arena = TaskArena('my_arena', 'local', 'remote')
+            sm = SyncManager(arena, IOManager(False))
+            with patch.object(TaskArena, 'get_local_tasks', return_value=[]), \
+                    patch.object(TaskArena, 'get_remote_tasks',
+                                 return_value=[]):
+                sm.sync()
+        finally:
+            profiling.disable()
+        names = [s['name'] for s in profiler.get_json()['spans']]
+        for name in ('sync', 'fetch local', 'fetch remote', 'generate',
+                     'suggest', 'user checks'):
+            self.assertIn(name, names)
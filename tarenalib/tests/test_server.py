@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from tarenalib.arena import SharedTask, TaskArena, EnhancedTaskWarrior
+from tarenalib.io import IOManager
+from tarenalib.server import ArenaServer, DaemonError, request
+from tarenalib.tests import patch_taskrc
+
+
+class TestArenaServer(unittest.TestCase):
+
+    def setUp(self):
+        self.patcher = patch('tasklib.task.TaskWarrior')
+        self.patcher.start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.configfile_name = os.path.join(self.tmpdir.name, 'config')
+        with open(self.configfile_name, 'w') as f:
+            json.dump({'arenas': [{'name': 'foo', 'local_data': 'local',
+                                   'remote_data': 'remote'}]}, f)
+        self.socket_name = os.path.join(self.tmpdir.name, 'config.sock')
+        self.server = ArenaServer(self.socket_name, self.configfile_name)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        patch_taskrc(self)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.tmpdir.cleanup()
+        self.patcher.stop()
+
+    def test_local(self):
+        task = SharedTask({'description': 'paint walls'})
+        with patch.object(TaskArena, 'get_local_tasks',
+                          return_value=[task]) as mock_tasks:
+            response = request(self.socket_name,
+                               {'command': 'local', 'arena': 'foo',
+                                'pattern': ['+home']})
+            request(self.socket_name, {'command': 'local', 'arena': 'foo'})
+        mock_tasks.assert_called_with([])
+        self.assertEqual(mock_tasks.call_args_list[0][0][0], ['+home'])
+        self.assertEqual(response, {'messages': [['paint walls', 0, 0]],
+                                    'error': None})
+
+    def test_config_is_kept_loaded(self):
+        te = self.server.task_emperor()
+        with patch.object(EnhancedTaskWarrior,
+                          'add_tasks_matching_pattern') as mock_add, \
+                patch.object(IOManager, 'get_task_emperor') as mock_load:
+            request(self.socket_name, {'command': 'add', 'arena': 'foo'})
+            request(self.socket_name, {'command': 'add', 'arena': 'foo'})
+        self.assertEqual(mock_add.call_count, 2)
+        self.assertFalse(mock_load.called)
+        self.assertIs(self.server.task_emperor(), te)
+        with open(self.configfile_name, 'w') as f:
+            json.dump({'arenas': []}, f)
+        self.assertIsNot(self.server.task_emperor(), te)
+
+    def test_own_saves_are_not_reloaded(self):
+        def save(te, iom, *args):
+            te.find('foo').last_sync = '20150101T000000Z'
+            iom.save_task_emperor(te)
+            return {}, None
+
+        te = self.server.task_emperor()
+        with patch('tarenalib.commands.sync', side_effect=save), \
+                patch.object(IOManager, 'get_task_emperor') as mock_load:
+            request(self.socket_name, {'command': 'sync', 'names': ['foo']})
+            self.assertIs(self.server.task_emperor(), te)
+            self.assertFalse(mock_load.called)
+        with open(self.configfile_name) as f:
+            self.assertEqual(json.load(f)['arenas'][0]['last_sync'],
+                             '20150101T000000Z')
+
+    def test_saves_after_changes_of_others_reload(self):
+        def save(te, iom, *args):
+            # another tarena adds an arena while the command runs
+            with open(self.configfile_name, 'w') as f:
+                json.dump({'arenas': [
+                    {'name': 'foo', 'local_data': 'local',
+                     'remote_data': 'remote'},
+                    {'name': 'bar', 'local_data': 'local',
+                     'remote_data': 'remote2'}]}, f)
+            iom.save_task_emperor(te)
+            return {}, None
+
+        te = self.server.task_emperor()
+        with patch('tarenalib.commands.sync', side_effect=save):
+            request(self.socket_name, {'command': 'sync', 'names': ['foo']})
+        self.assertIsNot(self.server.task_emperor(), te)
+        self.assertEqual(sorted(self.server.task_emperor().names),
+                         ['bar', 'foo'])
+
+    @patch('tarenalib.server.heartbeat_interval', 0.05)
+    @patch('tarenalib.server.response_timeout', 0.2)
+    def test_slow_commands_send_heartbeats(self):
+        def get_local_tasks(pattern):
+            time.sleep(0.5)
+            return []
+
+        with patch.object(TaskArena, 'get_local_tasks',
+                          side_effect=get_local_tasks):
+            response = request(self.socket_name,
+                               {'command': 'local', 'arena': 'foo'})
+        self.assertEqual(response, {'messages': [], 'error': None})
+
+    @patch('tarenalib.server.response_timeout', 0.1)
+    def test_unresponsive_daemon(self):
+        socket_name = self.socket_name + '.wedged'
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.bind(socket_name)
+            sock.listen(1)
+            self.assertRaises(DaemonError, request, socket_name,
+                              {'command': 'ping'})
+
+    def test_lost_connection(self):
+        with patch('socket.socket.sendall',
+                   side_effect=BrokenPipeError(32, 'Broken pipe')):
+            self.assertRaises(DaemonError, request, self.socket_name,
+                              {'command': 'add', 'arena': 'foo'})
+
+    def test_errors(self):
+        response = request(self.socket_name, {'command': 'local',
+                                              'arena': 'bar'})
+        self.assertEqual(response['messages'],
+                         [['Arena bar not found.', 0, 0]])
+        response = request(self.socket_name, {'command': 'delete'})
+        self.assertEqual(response['error'], 'Unknown command: delete')
+
+    def test_no_daemon(self):
+        self.assertIsNone(request(self.socket_name + '.missing',
+                                  {'command': 'ping'}))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+from tarenalib import commands
+from tarenalib.arena import SharedTask, TaskArena, EnhancedTaskWarrior
+from tarenalib.io import IOManager
+from tarenalib.merge import BaseStore
+from tarenalib.sqlstore import SQLiteTask, SQLiteTaskStore, compile_pattern
+from tarenalib.sync import SyncManager
+from tarenalib.tests import patch_taskrc
+
+
+class TestSQLiteTaskStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.remote_data = 'sqlite://' + os.path.join(self.tmpdir.name,
+                                                      'remote.db')
+        self.arena = TaskArena('house', 'local', self.remote_data)
+        patch_taskrc(self)
+
+    def tearDown(self):
+        self.arena.tw_remote.database.close()
+        self.tmpdir.cleanup()
+
+    def create_task(self, description):
+        task = SharedTask(SQLiteTask(None), self.arena)
+        task.tw_task['description'] = description
+        return task
+
+    def test_backend_is_selected_by_scheme(self):
+        self.assertIsInstance(self.arena.tw_remote, SQLiteTaskStore)
+        other = TaskArena('garden', 'local', self.remote_data,
+                          self.arena.pool)
+        self.assertIs(other.tw_remote.database, self.arena.tw_remote.database)
+
+    def test_save_and_read(self):
+        store = self.arena.tw_remote
+        tasks = [self.create_task('paint walls'), self.create_task('cut lawn')]
+        results = store.save_tasks(tasks)
+        self.assertEqual([error for task, error in results], [None, None])
+        self.assertTrue(tasks[0].tw_task['uuid'])
+        self.assertTrue(tasks[0].tw_task['modified'])
+        read = store.tasks(['Arena:house'])
+        self.assertEqual(sorted(t.tw_task['description'] for t in read),
+                         ['cut lawn', 'paint walls'])
+        self.assertEqual(store.tasks(['Arena:garden']), [])
+        found = store.tasks_by_arena_task_ids([tasks[1].ArenaTaskID])
+        self.assertEqual(found[0].tw_task['uuid'], tasks[1].tw_task['uuid'])
+        self.assertEqual(store.lookup(tasks[0].ArenaTaskID)[0],
+                         tasks[0].tw_task['uuid'])
+        tasks[0].tw_task['description'] = 'paint doors'
+        store.save_tasks([tasks[0]])
+        self.assertEqual(len(store.tasks(['Arena:house'])), 2)
+        self.assertEqual(len(store.tasks(['Arena:house',
+                                          'modified.after:20000101T000000Z',
+                                          'status:pending'])), 2)
+        self.assertEqual(store.tasks(['Arena:house',
+                                      'modified.after:29990101T000000Z']), [])
+
+    def test_compile_pattern(self):
+        condition, args, predicates = compile_pattern(
+            ['Arena:house', '(ArenaTaskID:a or ArenaTaskID:b)', 'status:pending'])
+        self.assertEqual(condition,
+                         'arena = ? AND arena_task_id IN (?, ?)')
+        self.assertEqual(args, ['house', 'a', 'b'])
+        self.assertEqual(len(predicates), 1)
+
+    def test_tasks_by_common_filters(self):
+        store = self.arena.tw_remote
+        tasks = [self.create_task('paint walls'), self.create_task('cut lawn')]
+        tasks[0].tw_task['project'] = 'Home.Kitchen'
+        tasks[0].tw_task['tags'] = set(['home'])
+        tasks[1].tw_task['project'] = 'Garden'
+        store.save_tasks(tasks)
+
+        def descriptions(pattern):
+            return [t.get('description')
+                    for t in store.tasks(['Arena:house'] + pattern)]
+
+        self.assertEqual(descriptions(['project:Home']), ['paint walls'])
+        self.assertEqual(descriptions(['+home']), ['paint walls'])
+        self.assertEqual(descriptions(['-home']), ['cut lawn'])
+        self.assertEqual(descriptions(['lawn']), ['cut lawn'])
+        with self.assertRaises(ValueError):
+            compile_pattern(['urgency.over:5'])
+
+    def test_unsupported_filter_is_reported(self):
+        te = MagicMock()
+        te.find.return_value = self.arena
+        iom = MagicMock()
+        commands.list_tasks(te, iom, 'house', 'remote', ['urgency.over:5'])
+        iom.send_message.assert_called_once_with(
+            'Filter not supported by the SQLite store: urgency.over:5')
+
+    @patch.object(BaseStore, 'save')
+    @patch.object(EnhancedTaskWarrior, 'save_tasks', return_value=[])
+    def test_sync_uploads_to_sqlite(self, mock_save_tasks, mock_save):
+        ltask = self.create_task('paint walls')
+        sm = SyncManager(self.arena, IOManager(False))
+        with patch.object(TaskArena, 'get_local_tasks', return_value=[ltask]), \
+                patch.object(TaskArena, 'tw_local'):
+            sm.sync(full=True, policy='newest')
+        remote_tasks = self.arena.get_remote_tasks()
+        self.assertEqual(len(remote_tasks), 1)
+        self.assertEqual(remote_tasks[0].ArenaTaskID, str(ltask.ArenaTaskID))
+        self.assertEqual(remote_tasks[0].tw_task['description'], 'paint walls')
@@ -18,13 +18,20 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 
 
+import os
+import tempfile
+import threading
 import unittest
 from unittest.mock import patch
 import tasklib.task as tlib
 
-from tarenalib.sync import SyncElement, SyncManager, SyncIOManager
-from tarenalib.arena import SharedTask, TaskArena
+from tarenalib.sync import SyncElement, SyncManager, SyncIOManager, \
+    sync_arenas
+from tarenalib.arena import SharedTask, TaskArena, EnhancedTaskWarrior
 from tarenalib.io import IOManager
+from tarenalib.journal import Journal
+from tarenalib.merge import BaseStore
+from tarenalib.tests import patch_taskrc
 
 from io import StringIO
 import sys
@@ -41,6 +48,7 @@ class TestSyncManager(unittest.TestCase):
     def setUp(self):
         self.patcher1 = patch('tasklib.task.TaskWarrior')
         self.MockClass1 = self.patcher1.start()
+        patch_taskrc(self)
 
     def tearDown(self):
         self.patcher1.stop()
@@ -70,6 +78,34 @@ class TestSyncManager(unittest.TestCase):
         self.assertEqual(num_downloads, 1)
         self.assertEqual(num_conflicts, 1)
 
+    def test_create_synclist_matches_by_arena_task_id(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        ltasks = [self.create_shared_task(arena, 'l' + str(i)) for i in range(3)]
+        rtasks = [self.create_shared_task(arena, 'r' + str(i)) for i in range(3)]
+        for i, ltask in enumerate(ltasks):
+            ltask.ArenaTaskID = str(i)
+        for i, rtask in enumerate(reversed(rtasks)):
+            rtask.ArenaTaskID = str(i + 1)
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(SharedTask, '__eq__', side_effect=AssertionError):
+            sm.generate_synclist(ltasks, rtasks)
+        self.assertEqual([e.suggestion for e in sm.synclist],
+                         ['UPLOAD', 'CONFLICT', 'CONFLICT', 'DOWNLOAD'])
+        self.assertIs(sm.synclist[1].remote_task, rtasks[2])
+        self.assertIs(sm.synclist[2].remote_task, rtasks[1])
+        self.assertIs(sm.synclist[3].remote_task, rtasks[0])
+
+    def test_create_synclist_skips_tasks_in_sync(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        ltask = self.create_shared_task(arena, 'clean floor')
+        rtask = self.create_shared_task(arena, 'clean floor')
+        rtask.ArenaTaskID = ltask.ArenaTaskID
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(SharedTask, 'different_fields') as mock_diff:
+            sm.generate_synclist([ltask], [rtask])
+        self.assertEqual(sm.synclist, [])
+        self.assertFalse(mock_diff.called)
+
     @patch.object(SharedTask, 'last_modified', side_effect=last_modified_mock)
     def test_suggest_conflict_resolution(self, mock_last_modified):
         arena = TaskArena('my_arena', 'local', 'remote')
@@ -100,8 +136,44 @@ class TestSyncManager(unittest.TestCase):
         self.assertEqual(num_uploads, 1)
         self.assertEqual(num_downloads, 2)
 
-    @patch.object(SharedTask, 'save')
-    def test_carry_out_sync(self, mock_save):
+    def test_suggest_merge(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        ltask = self.create_shared_task(arena, 'paint walls')
+        rtask = self.create_shared_task(arena, 'paint walls')
+        rtask.ArenaTaskID = ltask.ArenaTaskID
+        sm = SyncManager(arena, IOManager(False))
+        sm.base.set(ltask)
+        ltask.tw_task['description'] = 'paint ceilling'
+        rtask.tw_task['priority'] = 'H'
+        synclist = [SyncElement(ltask, rtask, ltask.different_fields(rtask),
+                                'CONFLICT')]
+        sm.synclist = synclist
+        sm.suggest_conflict_resolution()
+        self.assertEqual(synclist[0].suggestion, 'MERGE')
+        self.assertEqual(synclist[0].upload_fields, ['description'])
+        self.assertEqual(synclist[0].download_fields, ['priority'])
+
+    @patch.object(EnhancedTaskWarrior, 'save_tasks',
+                  side_effect=lambda tasks: [(t, None) for t in tasks])
+    def test_carry_out_merge(self, mock_save_tasks):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        ltask = self.create_shared_task(arena, 'paint ceilling')
+        rtask = self.create_shared_task(arena, 'paint walls')
+        rtask.ArenaTaskID = ltask.ArenaTaskID
+        rtask.tw_task['priority'] = 'H'
+        e = SyncElement(ltask, rtask, None, 'MERGE', 'MERGE')
+        e.upload_fields = ['description']
+        e.download_fields = ['priority']
+        sm = SyncManager(arena, IOManager(False))
+        sm.synclist = [e]
+        sm.carry_out_sync()
+        self.assertEqual(rtask.tw_task['description'], 'paint ceilling')
+        self.assertEqual(ltask.tw_task['priority'], 'H')
+        self.assertIn(ltask.ArenaTaskID, sm.base)
+
+    @patch.object(EnhancedTaskWarrior, 'save_tasks',
+                  side_effect=lambda tasks: [(t, None) for t in tasks])
+    def test_carry_out_sync(self, mock_save_tasks):
         arena = TaskArena('my_arena', 'local', 'remote')
         ltask1 = self.create_shared_task(arena, 'paint walls')
         ltask3 = self.create_shared_task(arena, 'do dishes')
@@ -123,6 +195,245 @@ class TestSyncManager(unittest.TestCase):
         self.assertEqual(synclist[2].local_task, synclist[2].remote_task)
         self.assertEqual(synclist[2].local_task.tw_task['priority'],
                          synclist[2].remote_task.tw_task['priority'])
+        self.assertEqual(mock_save_tasks.call_count, 2)
+        self.assertEqual(sm.failed_elements, [])
+
+    def test_sync_advances_last_sync(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(TaskArena, 'get_local_tasks', return_value=[]), \
+                patch.object(TaskArena, 'get_remote_tasks', return_value=[]):
+            sm.sync()
+        self.assertNotEqual(arena.last_sync, '')
+
+    def test_sync_saves_the_indexes(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(TaskArena, 'get_local_tasks', return_value=[]), \
+                patch.object(TaskArena, 'get_remote_tasks', return_value=[]), \
+                patch('tarenalib.index.TaskIndex.save') as mock_save:
+            arena.tw_local.index.set('my_arena', 'a1', 'u1', '')
+            sm.sync()
+        self.assertTrue(mock_save.called)
+
+    def test_sync_is_incremental(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        arena.last_sync = '20150101T000000Z'
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(TaskArena, 'get_local_tasks',
+                          return_value=[]) as mock_local, \
+                patch.object(TaskArena, 'get_remote_tasks',
+                             return_value=[]) as mock_remote, \
+                patch.object(TaskArena, 'add_partners',
+                             return_value=([], [])) as mock_partners:
+            sm.sync()
+        mock_local.assert_called_once_with(since='20150101T000000Z')
+        mock_remote.assert_called_once_with(since='20150101T000000Z')
+        mock_partners.assert_called_once_with([], [])
+        self.assertNotEqual(arena.last_sync, '20150101T000000Z')
+
+    @patch.object(BaseStore, 'save')
+    @patch.object(EnhancedTaskWarrior, 'save_tasks',
+                  side_effect=lambda tasks: [(t, None) for t in tasks])
+    def test_old_partners_keep_the_watermark(self, mock_save_tasks,
+                                             mock_save):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        arena.last_sync = '20260101T000000Z'
+        ltask = SharedTask(arena=arena, data={
+            'description': 'paint walls', 'ArenaTaskID': 'a1',
+            'modified': '20260102T000000Z'})
+        rtask = SharedTask(arena=arena, data={
+            'description': 'paint ceilling', 'ArenaTaskID': 'a1',
+            'modified': '20251001T000000Z'})
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(TaskArena, 'get_local_tasks',
+                          return_value=[ltask]), \
+                patch.object(TaskArena, 'get_remote_tasks', return_value=[]), \
+                patch.object(TaskArena, 'add_partners',
+                             return_value=([ltask], [rtask])):
+            sm.sync(policy='newest')
+        self.assertEqual(sm.synclist[0].action, 'UPLOAD')
+        self.assertGreater(arena.last_sync, '20260101T000000Z')
+
+    def test_sides_are_fetched_concurrently(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        sm = SyncManager(arena, IOManager(False))
+        barrier = threading.Barrier(2, timeout=5)
+
+        def fetch(*args, **kwargs):
+            barrier.wait()
+            return []
+
+        with patch.object(TaskArena, 'get_local_tasks', side_effect=fetch), \
+                patch.object(SyncManager, 'fetch_remote_tasks',
+                             side_effect=fetch):
+            self.assertEqual(sm.fetch_tasks(), ([], []))
+
+    def test_canceled_sync_keeps_last_sync(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        arena.last_sync = '20150101T000000Z'
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(SyncManager, 'fetch_tasks', return_value=([], [])), \
+                patch.object(SyncIOManager, 'user_checks_synclist',
+                             return_value=[]):
+            sm.sync()
+        self.assertEqual(arena.last_sync, '20150101T000000Z')
+
+    @patch.object(EnhancedTaskWarrior, 'save_tasks',
+                  side_effect=lambda tasks: [(t, None) for t in tasks])
+    def test_carry_out_sync_writes_journal(self, mock_save_tasks):
+        with tempfile.TemporaryDirectory() as remote:
+            arena = TaskArena('my_arena', 'local', remote)
+            ltask = self.create_shared_task(arena, 'paint walls')
+            rtask = self.create_shared_task(arena, 'paint ceilling')
+            rtask.ArenaTaskID = ltask.ArenaTaskID
+            sm = SyncManager(arena, IOManager(False))
+            sm.synclist = [SyncElement(ltask, rtask, ['description'], None,
+                                       'UPLOAD')]
+            sm.carry_out_sync()
+            entries, position = arena.journal.read(None)
+            self.assertIsNone(entries)
+            entries, position = arena.journal.read([position[0], 0])
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['id'], ltask.ArenaTaskID)
+        self.assertEqual(entries[0]['w'], arena.writer_id)
+        self.assertEqual(entries[0]['f'], {'description': 'paint walls'})
+
+    def test_sync_replays_journal(self):
+        with tempfile.TemporaryDirectory() as remote:
+            arena = TaskArena('my_arena', 'local', remote)
+            arena.last_sync = '20150101T000000Z'
+            journal = Journal(arena.journal_file)
+            journal.compact()
+            entries, arena.journal_position = journal.read(None)
+            journal.append([{'t': '', 'w': 'other', 'id': 'a1', 'f': {}},
+                            {'t': '', 'w': arena.writer_id, 'id': 'a2',
+                             'f': {}}])
+            sm = SyncManager(arena, IOManager(False))
+            with patch.object(TaskArena, 'get_local_tasks', return_value=[]), \
+                    patch.object(TaskArena, 'get_remote_tasks') as mock_remote, \
+                    patch.object(EnhancedTaskWarrior,
+                                 'tasks_by_arena_task_ids',
+                                 return_value=[]) as mock_ids:
+                sm.sync()
+            self.assertEqual(arena.journal_position[1],
+                             os.path.getsize(arena.journal_file))
+        mock_remote.assert_not_called()
+        self.assertEqual(mock_ids.call_args_list[0][0][0], set(['a1']))
+
+    def test_apply_policy(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        sm = SyncManager(arena, IOManager(False))
+        expected = {'newest': ['UPLOAD', 'DOWNLOAD', 'MERGE'],
+                    'local-wins': ['UPLOAD', 'UPLOAD', 'MERGE'],
+                    'remote-wins': ['UPLOAD', 'DOWNLOAD', 'MERGE'],
+                    'skip-conflicts': ['UPLOAD', 'SKIP', 'MERGE']}
+        for policy, actions in expected.items():
+            sm.synclist = [SyncElement(suggestion='UPLOAD'),
+                           SyncElement(suggestion='DOWNLOAD'),
+                           SyncElement(suggestion='MERGE')]
+            sm.synclist[1].conflict = True
+            sm.apply_policy(policy)
+            self.assertEqual([e.action for e in sm.synclist], actions)
+        self.assertRaises(ValueError, sm.apply_policy, 'foo')
+
+    @patch.object(BaseStore, 'save')
+    @patch.object(EnhancedTaskWarrior, 'save_tasks',
+                  side_effect=lambda tasks: [(t, None) for t in tasks])
+    def test_sync_with_policy(self, mock_save_tasks, mock_save):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        ltask = self.create_shared_task(arena, 'paint walls')
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(SyncManager, 'fetch_tasks',
+                          return_value=([ltask], [])), \
+                patch.object(SyncIOManager, 'user_checks_synclist') as mock_checks:
+            sm.sync(policy='newest')
+        self.assertFalse(mock_checks.called)
+        self.assertEqual(sm.synclist[0].action, 'UPLOAD')
+        self.assertNotEqual(arena.last_sync, '')
+        report = sm.report()
+        self.assertEqual(report['arena'], 'my_arena')
+        self.assertEqual(report['summary'], {'UPLOAD': 1})
+        self.assertEqual(report['elements'][0]['description'], 'paint walls')
+        self.assertEqual(report['elements'][0]['ArenaTaskID'],
+                         str(ltask.ArenaTaskID))
+
+    @patch.object(BaseStore, 'save')
+    @patch.object(EnhancedTaskWarrior, 'save_tasks', return_value=[])
+    def test_sync_stream(self, mock_save_tasks, mock_save):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        ltasks = [self.create_shared_task(arena, 'task %d' % i)
+                  for i in range(5)]
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(SyncManager, 'fetch_tasks',
+                          return_value=(iter(ltasks), [])):
+            sm.sync_stream(policy='newest', chunk_size=2)
+        saved = [len(c[0][0]) for c in mock_save_tasks.call_args_list]
+        self.assertEqual([n for n in saved if n], [2, 2, 1])
+        self.assertEqual(sm.synclist, [])
+        self.assertEqual(sm.summary(), {'UPLOAD': 5})
+        self.assertEqual(sm.report()['elements'], [])
+        self.assertNotEqual(arena.last_sync, '')
+
+    @patch.object(BaseStore, 'save')
+    @patch.object(EnhancedTaskWarrior, 'save_tasks', return_value=[])
+    def test_sync_stream_cancel(self, mock_save_tasks, mock_save):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        ltasks = [self.create_shared_task(arena, 'task %d' % i)
+                  for i in range(3)]
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(SyncManager, 'fetch_tasks',
+                          return_value=(ltasks, [])), \
+                patch.object(SyncIOManager, 'user_checks_synclist',
+                             return_value=None) as mock_checks:
+            sm.sync_stream(chunk_size=2)
+        self.assertEqual(mock_checks.call_count, 1)
+        self.assertFalse(mock_save_tasks.called)
+        self.assertEqual(arena.last_sync, '')
+
+    @patch.object(BaseStore, 'save')
+    @patch.object(EnhancedTaskWarrior, 'save_tasks', return_value=[])
+    def test_sync_stream_cancel_at_preview(self, mock_save_tasks, mock_save):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        ltasks = [self.create_shared_task(arena, 'task %d' % i)
+                  for i in range(6)]
+        sm = SyncManager(arena, IOManager(False))
+        with patch.object(SyncManager, 'fetch_tasks',
+                          return_value=(ltasks, [])), \
+                patch.object(IOManager, 'get_input',
+                             return_value='c') as mock_input:
+            sm.sync_stream(chunk_size=2)
+        self.assertEqual(mock_input.call_count, 1)
+        self.assertFalse(mock_save_tasks.called)
+        self.assertEqual(arena.last_sync, '')
+
+    def test_summary(self):
+        arena = TaskArena('my_arena', 'local', 'remote')
+        sm = SyncManager(arena, IOManager(False))
+        sm.synclist = [SyncElement(action='UPLOAD'),
+                       SyncElement(action='UPLOAD'),
+                       SyncElement(action='SKIP'),
+                       SyncElement(action='DOWNLOAD')]
+        sm.synclist[3].error = 'failed'
+        self.assertEqual(sm.summary(), {'UPLOAD': 2, 'SKIP': 1, 'FAILED': 1})
+
+    def test_sync_arenas(self):
+        managers = [SyncManager(TaskArena(name, 'local', 'remote'),
+                                IOManager(False))
+                    for name in ('a', 'b', 'c')]
+
+        def sync(sm, full, policy):
+            if sm.arena.name == 'b':
+                raise ValueError('broken')
+
+        with patch.object(SyncManager, 'sync', autospec=True,
+                          side_effect=sync) as mock_sync:
+            results = sync_arenas(managers, jobs=2)
+        self.assertEqual(mock_sync.call_count, 3)
+        self.assertEqual([sm for sm, error in results], managers)
+        self.assertIsNone(results[0][1])
+        self.assertEqual(str(results[1][1]), 'broken')
+        self.assertIsNone(results[2][1])
 
 
 class TestSyncElement(unittest.TestCase):
@@ -152,8 +463,20 @@ class TestSyncElement(unittest.TestCase):
         se = SyncElement()
         self.assertEqual(se.local_last_modified, '')
         se.local_task = SharedTask(tlib.Task())
-        se.local_task.last_modified = lambda: 'now'
-        self.assertEqual(se.local_last_modified, 'now')
+        with patch.object(SharedTask, 'last_modified', return_value='now'):
+            self.assertEqual(se.local_last_modified, 'now')
+
+
+    def test_compact_fields(self):
+        se = SyncElement(fields=['tags', 'description'], suggestion='MERGE')
+        self.assertEqual(se.fields, ['description', 'tags'])
+        self.assertEqual(se.suggestion, 'MERGE')
+        self.assertFalse(hasattr(se, '__dict__'))
+        se.upload_fields = []
+        self.assertEqual(se.upload_fields, [])
+        self.assertIsNone(se.download_fields)
+        with self.assertRaises(ValueError):
+            se.action = 'DELETE'
 
 
 class TestSyncIOManager(unittest.TestCase):
@@ -163,6 +486,7 @@ class TestSyncIOManager(unittest.TestCase):
         self.mystdout = StringIO()
         sys.stdout = self.mystdout
         self.iom = IOManager(show_output=False)
+        patch_taskrc(self)
 
     def tearDown(self):
         sys.stdout = self.old_stdout
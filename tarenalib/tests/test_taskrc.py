@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tarenalib import taskrc
+
+
+class TestTaskrc(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.user_taskrc = os.path.join(self.tmpdir.name, 'taskrc')
+        self.uda_file = os.path.join(self.tmpdir.name, 'arena.rc')
+        self.arena_taskrc = os.path.join(self.tmpdir.name, 'arena.taskrc')
+        self.patchers = [
+            patch.dict(os.environ, {'TASKRC': self.user_taskrc}),
+            patch('tarenalib.taskrc.uda_file', self.uda_file),
+            patch('tarenalib.taskrc.arena_taskrc', self.arena_taskrc),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        self.tmpdir.cleanup()
+
+    def read(self, filename):
+        with open(filename, 'r') as f:
+            return f.read()
+
+    def test_generate(self):
+        with open(self.user_taskrc, 'w') as f:
+            f.write('data.location=~/.task\n')
+        self.assertEqual(taskrc.generate(), self.arena_taskrc)
+        self.assertIn('uda.ArenaTaskID.type=string\n',
+                      self.read(self.uda_file))
+        self.assertEqual(self.read(self.arena_taskrc).splitlines()[1:],
+                         ['include ' + self.user_taskrc,
+                          'include ' + self.uda_file])
+
+    def test_generate_fails(self):
+        with patch('tarenalib.taskrc.uda_file',
+                   os.path.join(self.tmpdir.name, 'missing', 'arena.rc')):
+            self.assertIsNone(taskrc.generate())
+
+    def test_write_file_leaves_no_temporary_files(self):
+        taskrc.write_file(self.uda_file, 'a\n')
+        taskrc.write_file(self.uda_file, 'b\n')
+        self.assertEqual(os.listdir(self.tmpdir.name), ['arena.rc'])
+        self.assertEqual(self.read(self.uda_file), 'b\n')
+
+    def test_install_uninstall(self):
+        with open(self.user_taskrc, 'w') as f:
+            f.write('data.location=~/.task\nuda.Arena.type=string')
+        taskrc.install()
+        taskrc.install()
+        self.assertTrue(taskrc.is_installed())
+        self.assertEqual(self.read(self.user_taskrc).splitlines(),
+                         ['data.location=~/.task', 'uda.Arena.type=string',
+                          'include ' + self.uda_file])
+        taskrc.uninstall()
+        self.assertFalse(taskrc.is_installed())
+        self.assertEqual(self.read(self.user_taskrc),
+                         'data.location=~/.task\n')
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from tarenalib.arena import TaskArena
+from tarenalib.io import IOManager
+from tarenalib.watch import ArenaWatcher, PollingWatcher, create_watcher
+from tarenalib.tests import patch_taskrc
+
+
+class FakeWatcher(object):
+
+    def __init__(self, *results):
+        self.results = list(results)
+
+    def wait(self, timeout=None):
+        return self.results.pop(0) if self.results else set()
+
+
+class TestWatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dirs = {}
+        for name in ('local', 'remote_a', 'remote_b'):
+            self.dirs[name] = os.path.join(self.tmpdir.name, name)
+            os.mkdir(self.dirs[name])
+        self.arenas = [TaskArena('a', self.dirs['local'], self.dirs['remote_a']),
+                       TaskArena('b', self.dirs['local'], self.dirs['remote_b'])]
+        patch_taskrc(self)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name):
+        with open(os.path.join(self.dirs[name], 'pending.data'), 'a') as f:
+            f.write('[description:"x"]\n')
+
+    def test_polling_watcher(self):
+        watcher = PollingWatcher([self.dirs['local']], 0.01)
+        self.assertEqual(watcher.wait(0.02), set())
+        self.write('local')
+        self.assertEqual(watcher.wait(0.02), {self.dirs['local']})
+
+    def test_create_watcher(self):
+        self.assertIsInstance(create_watcher([self.dirs['local']], poll=True),
+                              PollingWatcher)
+
+    @patch('tarenalib.commands.sync', return_value=({}, None))
+    def test_step_syncs_affected_arenas(self, mock_sync):
+        self.write('remote_b')
+        watcher = FakeWatcher({self.dirs['remote_b']}, {self.dirs['remote_a']})
+        arena_watcher = ArenaWatcher(None, IOManager(False), self.arenas,
+                                     watcher=watcher, debounce=0.01)
+        self.assertEqual(arena_watcher.step(), [])
+        self.write('remote_b')
+        watcher.results = [{self.dirs['remote_b']}, {self.dirs['remote_a']},
+                           {self.dirs['remote_b']}]
+        self.assertEqual(arena_watcher.step(), ['b'])
+        mock_sync.assert_called_once_with(None, arena_watcher.iom, ['b'],
+                                          policy='newest')
+        self.write('local')
+        watcher.results = [{self.dirs['local']}]
+        self.assertEqual(arena_watcher.step(), ['a', 'b'])
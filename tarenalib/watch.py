@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+
+# TaskArena - Adding collaborative functionality to TaskWarrior
+# Copyright (C) 2015  Nikolai Nowaczyk
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from tarenalib import commands
+from tarenalib.native import data_files
+from tarenalib.sqlstore import is_sqlite_location
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+watch_mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+event_header = struct.Struct('iIII')
+
+
+def data_location_key(data_location):
+    return os.path.abspath(os.path.expanduser(data_location))
+
+
+def data_stamps(directory):
+    """ Returns the modification times and sizes of the data files in
+        directory.
+    """
+    stamps = []
+    for filename in data_files:
+        try:
+            stat = os.stat(os.path.join(directory, filename))
+            stamps.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+class PollingWatcher(object):
+    """ Notices changes of data files by comparing their stamps every
+        interval seconds.
+    """
+
+    def __init__(self, directories, interval=5.0):
+        self.interval = interval
+        self.stamps = dict((d, data_stamps(d)) for d in directories)
+
+    def wait(self, timeout=None):
+        """ Returns the directories whose data files may have changed,
+            waiting at most timeout seconds, or forever if it is None.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for directory, stamps in self.stamps.items():
+                new_stamps = data_stamps(directory)
+                if new_stamps != stamps:
+                    self.stamps[directory] = new_stamps
+                    changed.add(directory)
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return changed
+                time.sleep(min(self.interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """ Notices changes of data files through the inotify API of Linux. """
+
+    def __init__(self, directories):
+        libc_name = ctypes.util.find_library('c')
+        if not libc_name:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        try:
+            for directory in directories:
+                wd = libc.inotify_add_watch(self.fd, os.fsencode(directory),
+                                            watch_mask)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(),
+                                  "Cannot watch " + directory)
+                self.directories[wd] = directory
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def wait(self, timeout=None):
+        """ Returns the directories whose data files may have changed,
+            waiting at most timeout seconds, or forever if it is None.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        changed = set()
+        if not readable:
+            return changed
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(buf):
+            wd, mask, cookie, length = event_header.unpack_from(buf, offset)
+            offset += event_header.size
+            name = buf[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if os.fsdecode(name) in data_files and wd in self.directories:
+                changed.add(self.directories[wd])
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def create_watcher(directories, poll=False, interval=5.0):
+    """ Returns an InotifyWatcher, or a PollingWatcher if poll is set or
+        inotify cannot be used.
+    """
+    if not poll:
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directories, interval)
+
+
+class ArenaWatcher(object):
+    """ Syncs the arenas whose local or remote data files change. """
+
+    def __init__(self, te, iom, arenas, policy='newest', debounce=2.0,
+                 max_delay=30.0, poll=False, interval=5.0, watcher=None):
+        self.te = te
+        self.iom = iom
+        self.policy = policy
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.arena_names = {}
+        for arena in arenas:
+            for data_location in (arena.local_data, arena.remote_data):
+                if is_sqlite_location(data_location):
+                    continue
+                self.arena_names.setdefault(
+                    data_location_key(data_location), []).append(arena.name)
+        self.stamps = dict((d, data_stamps(d)) for d in self.arena_names)
+        self.watcher = watcher if watcher else \
+            create_watcher(self.directories, poll, interval)
+
+    @property
+    def directories(self):
+        return list(self.arena_names)
+
+    def collect_changes(self):
+        """ Waits for changes and then until no more changes arrive for
+            debounce seconds, at most max_delay seconds. Returns the
+            directories whose data files have changed since they were last
+            collected. The writes of a sync are collected afterwards as well,
+            but the sync they cause finds nothing to do and writes nothing.
+        """
+        candidates = set(self.watcher.wait())
+        deadline = time.monotonic() + self.max_delay
+        while True:
+            timeout = min(self.debounce, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+            more = self.watcher.wait(timeout)
+            if not more:
+                break
+            candidates |= more
+        changed = set()
+        for directory in candidates & set(self.stamps):
+            stamps = data_stamps(directory)
+            if stamps != self.stamps[directory]:
+                self.stamps[directory] = stamps
+                changed.add(directory)
+        return changed
+
+    def sync(self, names):
+        self.iom.send_message(time.strftime('%H:%M:%S') + " Syncing " +
+                              ', '.join(names) + ".")
+        report, error = commands.sync(self.te, self.iom, names,
+                                      policy=self.policy)
+        if error:
+            self.iom.send_message("Syncing " + names[0] + " failed: " +
+                                  str(error))
+
+    def step(self):
+        """ Waits for the next changes and syncs the affected arenas. """
+        changed = self.collect_changes()
+        names = []
+        for directory in sorted(changed):
+            for name in self.arena_names[directory]:
+                if name not in names:
+                    names.append(name)
+        if names:
+            self.sync(names)
+        return names
+
+    def run(self):
+        self.sync(sorted(set(name for names in self.arena_names.values()
+                             for name in names)))
+        while True:
+            self.step()